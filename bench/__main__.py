@@ -0,0 +1,55 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+from bench import benchmarks
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _compare(results, baseline_path):
+    with open(baseline_path) as file:
+        baseline = json.load(file)['results']
+    print('{:<28} {:>14} {:>14} {:>8}'.format('benchmark', 'baseline (s)', 'current (s)', 'speedup'))
+    for (name, result) in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]['seconds']
+        new = result['seconds']
+        print('{:<28} {:>14.6f} {:>14.6f} {:>7.2f}x'.format(name, old, new, old / new if new else float('inf')))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='bench', description='Benchmark the PassKeep hot paths.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1_000, 100_000],
+                        help='numbers of vaults in the generated accounts')
+    parser.add_argument('--output', '-o', type=str, help='JSON file to store the results in')
+    parser.add_argument('--compare', '-c', type=str, help='JSON results of an earlier run to compare against')
+    args = parser.parse_args()
+    commit = _commit()
+    results = benchmarks.run(args.sizes)
+    report = {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    output = args.output or os.path.join('bench', 'results', '{}.json'.format(commit))
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    for (name, result) in results.items():
+        print('{:<28} {:>14.6f} s'.format(name, result['seconds']))
+    print('Results written to {}'.format(output))
+    if args.compare:
+        _compare(results, args.compare)
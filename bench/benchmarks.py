@@ -0,0 +1,137 @@
+import os
+import statistics
+import string
+import tempfile
+import time
+
+from bench import generate
+from src import connection
+from src import constants
+from src import crypt_utils
+from src import password_utils
+from src import pattern_strength
+from src.account import Account
+
+CHARACTERS = string.ascii_letters + string.digits + string.punctuation
+
+
+def measure(function, repeat=5, number=1):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number)
+    median = statistics.median(timings)
+    return {'seconds': median, 'min': min(timings), 'ops_per_second': 1 / median if median else None}
+
+
+def bench_login(db, accounts):
+    (username, password) = next(iter(accounts[10].items()))
+    return {'account_login': measure(lambda: Account(username, password, db), repeat=3)}
+
+
+def bench_kdf():
+    salt = crypt_utils.byte_string(crypt_utils.generate_salt())
+    results = {}
+    for backend in crypt_utils.kdf_backends():
+        results['pbkdf2_{}'.format(backend)] = measure(
+            lambda: crypt_utils.pbkdf2('password', salt, constants.HASH_ROUNDS, backend), repeat=3)
+    params = crypt_utils.format_kdf_params({'n': constants.SCRYPT_MIN_COST, 'r': constants.SCRYPT_BLOCK_SIZE,
+                                            'p': constants.SCRYPT_PARALLELISM})
+    results['scrypt_min_cost'] = measure(lambda: crypt_utils.time_kdf(constants.KDF_SCRYPT, params), repeat=3)
+    return results
+
+
+def bench_vaults(db, accounts):
+    results = {}
+    for (size, credentials) in accounts.items():
+        (username, password) = next(iter(credentials.items()))
+        account = Account(username, password, db)
+        results['get_vaults_{}'.format(size)] = measure(account.vaults._get_vaults, repeat=3)
+    return results
+
+
+def bench_rekey(db, accounts, size):
+    (username, password) = next(iter(accounts[size].items()))
+    account = Account(username, password, db)
+    keys = iter([crypt_utils.generate_hash(password)[0] for _ in range(3)])
+    return {'update_vaults_crypt_{}'.format(size): measure(lambda: account.vaults.update_vaults_crypt(next(keys)),
+                                                           repeat=3)}
+
+
+def bench_add_vault(db):
+    password = generate.create_account(db, 'bench-add', 0)
+    account = Account('bench-add', password, db)
+    names = iter(range(10 ** 9))
+
+    def add_vault():
+        account.vaults.add_vault('vault-{}'.format(next(names)), 'description', 'password')
+    return {'add_vault': measure(add_vault, repeat=3, number=100)}
+
+
+def bench_leaked():
+    miss = password_utils.random_password(CHARACTERS, 20)
+    connection.is_password_leaked(miss)
+    return {
+        'is_password_leaked_hit': measure(lambda: connection.is_password_leaked('password'), number=1000),
+        'is_password_leaked_miss': measure(lambda: connection.is_password_leaked(miss), number=1000),
+    }
+
+
+def bench_generation():
+    def random_passwords():
+        for _ in password_utils.random_passwords(CHARACTERS, 25, 10_000):
+            pass
+
+    def dicewares():
+        for _ in password_utils.random_dicewares('.', 6, 10_000):
+            pass
+    return {
+        'random_password': measure(lambda: password_utils.random_password(CHARACTERS, 25), number=1000),
+        'random_passwords_10k': measure(random_passwords),
+        'random_diceware': measure(lambda: password_utils.random_diceware('.', 6), number=1000),
+        'random_dicewares_10k': measure(dicewares),
+    }
+
+
+def bench_scoring():
+    passwords = list(password_utils.random_passwords(CHARACTERS, 16, 1000)) + ['lather.busybody', 'qwertyuiop']
+
+    def score():
+        for password in passwords:
+            password_utils.Password(password)
+
+    def estimate():
+        for password in passwords:
+            pattern_strength.estimate(password, leaked=False)
+    return {
+        'password_score_1k': measure(score),
+        'pattern_estimate_1k': measure(estimate),
+    }
+
+
+def run(sizes, log=print):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'passkeep.db')
+        db = generate.create_database(path)
+        accounts = {}
+        for size in sorted(set(sizes) | {10}):
+            log('Generating an account with {} vaults'.format(size))
+            username = 'bench-{}'.format(size)
+            accounts[size] = {username: generate.create_account(db, username, size)}
+        benchmarks = [
+            ('login', lambda: bench_login(db, accounts)),
+            ('key derivation', bench_kdf),
+            ('vault loading', lambda: bench_vaults(db, accounts)),
+            ('re-encryption', lambda: bench_rekey(db, accounts, min(max(sizes), 1000))),
+            ('vault insertion', lambda: bench_add_vault(db)),
+            ('leak checks', bench_leaked),
+            ('generation', bench_generation),
+            ('scoring', bench_scoring),
+        ]
+        for (name, benchmark) in benchmarks:
+            log('Running {} benchmarks'.format(name))
+            results.update(benchmark())
+    return results
@@ -0,0 +1,52 @@
+import argparse
+import os
+import random
+import string
+
+from src import connection
+from src import password_utils
+from src.account import Account
+from src.connection import Connection
+
+CHARACTERS = string.ascii_letters + string.digits + string.punctuation
+
+
+def create_database(path):
+    if os.path.exists(path):
+        os.remove(path)
+    return Connection(path)
+
+
+def add_vaults(account, count):
+    passwords = password_utils.random_passwords(CHARACTERS, 20, count)
+    with account._db.transaction():
+        for (i, password) in enumerate(passwords):
+            description = ' '.join(random.choice(connection.diceware_words()) for _ in range(5))
+            account.vaults.add_vault('vault-{:06d}'.format(i), description, password)
+
+
+def create_account(db, username, vault_count):
+    password = password_utils.random_password(CHARACTERS, 20)
+    Account.signup(username, password, password, db)
+    account = Account(username, password, db)
+    add_vaults(account, vault_count)
+    return password
+
+
+def populate(path, accounts, vaults_per_account):
+    db = create_database(path)
+    credentials = {}
+    for i in range(accounts):
+        username = 'bench-{}-{}'.format(vaults_per_account, i)
+        credentials[username] = create_account(db, username, vaults_per_account)
+    return credentials
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Populate a scratch database with synthetic accounts and vaults.')
+    parser.add_argument('--db', type=str, default='bench_passkeep.db')
+    parser.add_argument('--accounts', type=int, default=1)
+    parser.add_argument('--vaults', type=int, default=1000)
+    args = parser.parse_args()
+    for (username, password) in populate(args.db, args.accounts, args.vaults).items():
+        print('{} {}'.format(username, password))
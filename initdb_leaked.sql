@@ -4,6 +4,7 @@
 
 DROP TABLE IF EXISTS leaked_passwords;
 
+/* The unique index on password is built by populate_leaked_db.py once every row is loaded */
 CREATE TABLE leaked_passwords (
-    password VARCHAR(50) PRIMARY KEY
+    password VARCHAR(50) NOT NULL
 );
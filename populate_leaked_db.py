@@ -1,29 +1,91 @@
+from collections import deque
+import multiprocessing
 import os
 import sqlite3
+import time
 
 from src.constants import DB_LEAKED_PASSWORDS
 
 MIN_FREQUENCY_TO_STORE = 100
+CHUNK_SIZE = 16 * 1024 * 1024
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+
+def read_chunks(file, offset):
+    file.seek(offset)
+    while True:
+        chunk = file.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        chunk += file.readline()
+        offset += len(chunk)
+        yield chunk, offset
+
+
+def parse_chunk(chunk):
+    passwords = []
+    lines = chunk.splitlines()
+    for line in lines:
+        (password, occurrences) = line.split(b':')
+        if int(occurrences) >= MIN_FREQUENCY_TO_STORE:
+            passwords.append((password.decode('ascii'),))
+    return passwords, len(lines)
+
+
+def prepare(db):
+    db.execute('PRAGMA journal_mode = WAL')
+    db.execute('PRAGMA synchronous = OFF')
+    db.execute('PRAGMA cache_size = -262144')
+    db.execute('PRAGMA temp_store = MEMORY')
+    with db:
+        db.execute('CREATE TABLE IF NOT EXISTS import_progress (byte_offset INTEGER NOT NULL, added INTEGER NOT NULL)')
+        entries = db.execute('SELECT byte_offset, added FROM import_progress').fetchone()
+        if entries:
+            return entries
+        db.execute('INSERT INTO import_progress (byte_offset, added) VALUES (0, 0)')
+    return 0, 0
+
+
+def finish(db):
+    print('Building index')
+    with db:
+        db.execute('CREATE UNIQUE INDEX IF NOT EXISTS leaked_passwords_password ON leaked_passwords (password)')
+        db.execute('DROP TABLE import_progress')
+    db.execute('PRAGMA journal_mode = DELETE')
+
 
 if __name__ == '__main__':
     file_name = 'leaked_passwords.txt'  # From: https://haveibeenpwned.com/Passwords
     file_size = os.stat(file_name).st_size
-    average_bytes_per_password = 44
-    password_count = file_size / average_bytes_per_password
     db = sqlite3.connect(DB_LEAKED_PASSWORDS)
-    with open(file_name) as file:
-        added_count = 0
-        line_count = 0
-        with db:
-            for line in file:
-                line_count += 1
-                if line_count % 10_000_000 == 0:
-                    print('  {:.1f}% complete'.format(line_count * 100 / password_count))
-                strings = line.split(':')
-                password = strings[0]
-                occurrences = int(strings[1].rstrip('\n'))
-                if occurrences < MIN_FREQUENCY_TO_STORE:
-                    continue
-                added_count += 1
-                db.execute('INSERT INTO leaked_passwords (password) VALUES (?)', (password,))
+    if db.execute("SELECT name FROM sqlite_master WHERE name = 'leaked_passwords_password'").fetchone():
+        raise SystemExit('The leaked password database is already built, run make create_leaked_db to rebuild it')
+    (offset, added_count) = prepare(db)
+    if offset:
+        print('Resuming at {:.1f}%'.format(offset * 100 / file_size))
+    line_count = 0
+    start_time = time.monotonic()
+    workers = os.cpu_count() or 1
+    with open(file_name, 'rb') as file, multiprocessing.Pool(workers) as pool:
+        pending = deque()
+        chunks = read_chunks(file, offset)
+        while True:
+            while len(pending) < workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending.append((pool.apply_async(parse_chunk, (chunk[0],)), chunk[1]))
+            if not pending:
+                break
+            (result, offset) = pending.popleft()
+            (passwords, lines) = result.get()
+            line_count += lines
+            added_count += len(passwords)
+            with db:
+                db.executemany('INSERT INTO leaked_passwords (password) VALUES (?)', passwords)
+                db.execute('UPDATE import_progress SET byte_offset = ?, added = ?', (offset, added_count))
+            elapsed = max(time.monotonic() - start_time, 1e-9)
+            print('  {:.1f}% complete ({:.1f} million added, {:.0f} lines/sec)'
+                  .format(offset * 100 / file_size, added_count / 1_000_000, line_count / elapsed))
+    finish(db)
     print('Done adding passwords (added {} million)'.format(added_count / 1_000_000))
@@ -0,0 +1,13 @@
+import sqlite3
+
+from src import leak_filter
+from src.constants import DB_LEAKED_PASSWORDS
+from src.constants import LEAKED_FILTER
+
+if __name__ == '__main__':
+    db = sqlite3.connect(DB_LEAKED_PASSWORDS)
+    with db:
+        count = db.execute('SELECT COUNT(password) FROM leaked_passwords').fetchone()[0]
+        rows = db.execute('SELECT password FROM leaked_passwords')
+        leak_filter.build(LEAKED_FILTER, (bytes.fromhex(row[0]) for row in rows), count)
+    print('Done building filter ({} million passwords)'.format(count / 1_000_000))
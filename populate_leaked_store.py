@@ -0,0 +1,15 @@
+from src import leaked_store
+from src.constants import LEAKED_STORE
+
+
+def _digests(file):
+    for line in file:
+        yield bytes.fromhex(line[:40])
+
+
+if __name__ == '__main__':
+    # From: https://haveibeenpwned.com/Passwords, the SHA-1 download ordered by hash
+    file_name = 'leaked_passwords.txt'
+    with open(file_name) as file:
+        count = leaked_store.build(LEAKED_STORE, _digests(file))
+    print('Done building store (added {} million)'.format(count / 1_000_000))
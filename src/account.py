@@ -3,28 +3,77 @@ import unicodedata
 
 from src import crypt_utils
 from src import constants
+from src import pattern_strength
 from src.connection import Connection
 from src.connection import is_password_leaked
 from src.exceptions import AccountException
 from src.vaults import Vaults
 
 
+def _call(function, *arguments):
+    return function(*arguments)
+
+
 class Account:
-    def __init__(self, username, password):
+    # Every key derivation goes through kdf, which lets callers run it elsewhere, such as in a process pool
+    def __init__(self, username, password, db=None, kdf=None):
         if not username or not password:
             raise AccountException('must fill in fields')
         self._username = username
-        self._db = Connection()
-        statement = 'SELECT auth_key, auth_salt, crypt_salt FROM account WHERE username = ?'
+        self._db = db or Connection()
+        self._kdf = kdf or _call
+        statement = ('SELECT auth_key, auth_salt, crypt_salt, kdf_version, kdf_algorithm, kdf_params FROM account '
+                     'WHERE username = ?')
         entries = self._db.query(statement, (self._username,))
         if not entries:
             raise AccountException('username incorrect')
+        (stored_auth_key, auth_salt, crypt_salt, kdf_version, kdf_algorithm, kdf_params) = entries
         main_key = unicodedata.normalize('NFKD', password)
-        auth_key = crypt_utils.hash_with_salt(main_key, entries[1])
-        if auth_key != entries[0]:
-            raise AccountException('password incorrect')
-        crypt_key = crypt_utils.hash_with_salt(main_key, entries[2])
+        master_key = self._kdf(crypt_utils.hash_with_salt, main_key, auth_salt, kdf_algorithm, kdf_params)
+        if kdf_version == constants.KDF_VERSION_LEGACY:
+            if master_key != stored_auth_key:
+                raise AccountException('password incorrect')
+            crypt_key = self._kdf(crypt_utils.hash_with_salt, main_key, crypt_salt, kdf_algorithm, kdf_params)
+        else:
+            auth_key, crypt_key = crypt_utils.expand_keys(master_key, crypt_salt)
+            if auth_key != stored_auth_key:
+                raise AccountException('password incorrect')
         self.vaults = Vaults(self._username, self._db, crypt_key)
+        policy = self.kdf_policy(self._db)
+        # The legacy auth key was stored in the database, so it must not become the master key of the current scheme
+        if policy != (kdf_algorithm, kdf_params) or kdf_version == constants.KDF_VERSION_LEGACY:
+            self._store_keys(main_key, policy)
+
+    @staticmethod
+    def kdf_policy(db=None):
+        db = db or Connection()
+        entries = db.query_all('SELECT name, value FROM setting WHERE name IN (?, ?)', ('kdf_algorithm', 'kdf_params'))
+        settings = dict(entries)
+        return (settings.get('kdf_algorithm', constants.KDF_PBKDF2),
+                settings.get('kdf_params', constants.KDF_DEFAULT_PARAMS))
+
+    @staticmethod
+    def set_kdf_policy(algorithm, params, db=None):
+        db = db or Connection()
+        with db.transaction():
+            db.execute_many('INSERT OR REPLACE INTO setting (name, value) VALUES (?, ?)',
+                            [('kdf_algorithm', algorithm), ('kdf_params', params)])
+
+    @staticmethod
+    def _derive_keys(main_key, policy, kdf=_call):
+        master_key, auth_salt = kdf(crypt_utils.generate_hash, main_key, *policy)
+        crypt_salt = crypt_utils.generate_salt()
+        auth_key, crypt_key = crypt_utils.expand_keys(master_key, crypt_salt)
+        return auth_key, auth_salt, crypt_key, crypt_salt
+
+    def _store_keys(self, main_key, policy, progress=None):
+        auth_key, auth_salt, crypt_key, crypt_salt = self._derive_keys(main_key, policy, self._kdf)
+        statement = ('UPDATE account SET auth_key = ?, auth_salt = ?, crypt_salt = ?, kdf_version = ?, '
+                     'kdf_algorithm = ?, kdf_params = ? WHERE username = ?')
+        with self._db.transaction():
+            self._db.execute(statement, (auth_key, auth_salt, crypt_salt, constants.KDF_VERSION_HKDF, *policy,
+                                         self._username))
+            self.vaults.update_vaults_crypt(crypt_key, progress)
 
     @staticmethod
     def _validate_username(username, old_username=None):
@@ -45,22 +94,24 @@ class Account:
             raise AccountException('password must not equal username')
         if is_password_leaked(password):
             raise AccountException('password is present in a public data leak')
+        if pattern_strength.estimate(password, leaked=False).entropy < constants.PASSWORD_MIN_ENTROPY:
+            raise AccountException('password is too easy to guess')
 
     @staticmethod
-    def signup(username, password, confirm_password):
+    def signup(username, password, confirm_password, db=None, kdf=_call):
         Account._validate_username(username)
         Account._validate_password(password, confirm_password, username)
-        db = Connection()
+        db = db or Connection()
         entries = db.query('SELECT username FROM account WHERE username = ?', (username,))
         if entries:
             raise AccountException('username already exists')
         main_key = unicodedata.normalize('NFKD', password)
-        auth_key, auth_salt = crypt_utils.generate_hash(main_key)
-        crypt_key, crypt_salt = crypt_utils.generate_hash(main_key)
+        policy = Account.kdf_policy(db)
+        auth_key, auth_salt, _, crypt_salt = Account._derive_keys(main_key, policy, kdf)
         now = datetime.now()
-        insert = (username, auth_key, auth_salt, crypt_salt, now, now)
-        db.execute('INSERT INTO account (username, auth_key, auth_salt, crypt_salt, modified, created) '
-                   'VALUES (?, ?, ?, ?, ?, ?)', insert)
+        insert = (username, auth_key, auth_salt, crypt_salt, constants.KDF_VERSION_HKDF, *policy, now, now)
+        db.execute('INSERT INTO account (username, auth_key, auth_salt, crypt_salt, kdf_version, kdf_algorithm, '
+                   'kdf_params, modified, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', insert)
 
     def edit_username(self, new_username):
         self._validate_username(new_username, self._username)
@@ -70,14 +121,10 @@ class Account:
         self._db.execute('UPDATE account SET username = ? WHERE username = ?', (new_username, self._username))
         self.vaults.update_username(new_username)
 
-    def edit_password(self, password, confirm_password):
+    def edit_password(self, password, confirm_password, progress=None):
         self._validate_password(password, confirm_password)
         main_key = unicodedata.normalize('NFKD', password)
-        auth_key, auth_salt = crypt_utils.generate_hash(main_key)
-        crypt_key, crypt_salt = crypt_utils.generate_hash(main_key)
-        statement = 'UPDATE account SET auth_key = ?, auth_salt = ?, crypt_salt = ? WHERE username = ?'
-        self._db.execute(statement, (auth_key, auth_salt, crypt_salt, self._username))
-        self.vaults.update_vaults_crypt(crypt_key)
+        self._store_keys(main_key, self.kdf_policy(self._db), progress)
 
     def delete_user(self):
         self._db.execute('DELETE FROM account WHERE username = ?', (self._username,))
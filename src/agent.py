@@ -0,0 +1,240 @@
+import json
+import os
+import socket
+import socketserver
+import stat
+import tempfile
+
+from src import config
+from src import constants
+from src import connection
+from src import exceptions
+from src.account import Account
+from src.connection import Connection
+from src.exceptions import AgentException
+from src.exceptions import UserInputException
+
+ACCOUNT_METHODS = {'edit_username', 'edit_password', 'delete_user'}
+VAULTS_METHODS = {'get_vault_names', 'get_vault_data', 'add_vault', 'delete_vault', 'edit_vault_name',
+                  'edit_vault_description', 'edit_vault_password', 'audit', 'search'}
+
+
+def default_socket_path():
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        directory = os.path.join(runtime, constants.AGENT_DIRECTORY)
+    else:
+        directory = os.path.join(tempfile.gettempdir(), 'passkeep-{}'.format(os.getuid()))
+    return os.path.join(directory, constants.AGENT_SOCKET)
+
+
+def _check_owned(path, kind):
+    status = os.lstat(path)
+    if stat.S_ISLNK(status.st_mode) or status.st_uid != os.getuid():
+        raise AgentException('agent {} "{}" is not owned by this user'.format(kind, path))
+    return status
+
+
+def check_socket_path(path):
+    # Another local user could otherwise create the directory first and receive passwords through a fake agent
+    directory = _check_owned(os.path.dirname(path), 'directory')
+    if not stat.S_ISDIR(directory.st_mode) or stat.S_IMODE(directory.st_mode) != 0o700:
+        raise AgentException('agent directory "{}" must be a directory with mode 0700'.format(os.path.dirname(path)))
+    if os.path.lexists(path) and not stat.S_ISSOCK(_check_owned(path, 'socket').st_mode):
+        raise AgentException('agent socket "{}" is not a socket'.format(path))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line.decode('utf-8'))
+            response = {'result': self.server.dispatch(request)}
+        except UserInputException as e:
+            response = {'error': str(e), 'type': type(e).__name__}
+        except Exception as e:
+            response = {'error': 'agent failure: {}'.format(e), 'type': AgentException.__name__}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+class AgentServer(socketserver.UnixStreamServer):
+    def __init__(self, path=None, idle_timeout=constants.AGENT_IDLE_TIMEOUT, database=None):
+        self.path = path or default_socket_path()
+        self.database = database or config.database_path()
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        _check_owned(directory, 'directory')
+        os.chmod(directory, 0o700)
+        check_socket_path(self.path)
+        if os.path.exists(self.path):
+            if AgentClient(self.path).is_running():
+                raise AgentException('agent is already running')
+            os.unlink(self.path)
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(self.path, _Handler)
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.path, 0o600)
+        self.timeout = idle_timeout
+        self._accounts = {}
+        self._running = True
+
+    def run(self):
+        connection.open_reference_databases()
+        try:
+            while self._running:
+                self.handle_request()
+        finally:
+            self.server_close()
+
+    def handle_timeout(self):
+        self._accounts.clear()
+
+    def server_close(self):
+        super().server_close()
+        self._accounts.clear()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _account(self, username):
+        if username not in self._accounts:
+            raise AgentException('user "{}" is not unlocked in the agent'.format(username))
+        return self._accounts[username]
+
+    def dispatch(self, request):
+        command = request['command']
+        if command == 'status':
+            return request['username'] in self._accounts
+        if command == 'unlock':
+            self._accounts[request['username']] = Account(request['username'], request['password'],
+                                                          Connection(self.database))
+            return True
+        if command == 'lock':
+            self._accounts.clear()
+            return True
+        if command == 'stop':
+            self._running = False
+            return True
+        if command == 'leaked':
+            return connection.is_password_leaked(request['password'])
+        if command == 'call':
+            return self._call(request['username'], request['target'], request['method'], request['arguments'])
+        raise AgentException('unknown agent command "{}"'.format(command))
+
+    def _call(self, username, target, method, arguments):
+        account = self._account(username)
+        if target == 'account' and method in ACCOUNT_METHODS:
+            result = getattr(account, method)(*arguments)
+            if method == 'edit_username':
+                self._accounts[arguments[0]] = self._accounts.pop(username)
+            elif method == 'delete_user':
+                self._accounts.pop(username)
+            return result
+        if target == 'vaults' and method in VAULTS_METHODS:
+            return getattr(account.vaults, method)(*arguments)
+        raise AgentException('method "{}" is not available through the agent'.format(method))
+
+
+class AgentClient:
+    def __init__(self, path=None):
+        self.path = path or default_socket_path()
+
+    def _request(self, command, **arguments):
+        arguments['command'] = command
+        check_socket_path(self.path)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.path)
+            sock.sendall(json.dumps(arguments).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as file:
+                line = file.readline()
+        if not line:
+            raise AgentException('agent closed the connection')
+        response = json.loads(line.decode('utf-8'))
+        if 'error' in response:
+            exception = getattr(exceptions, response['type'], AgentException)
+            raise exception(response['error'])
+        return response['result']
+
+    def is_running(self):
+        if not os.path.exists(self.path):
+            return False
+        try:
+            self._request('status', username='')
+        except (OSError, AgentException):
+            return False
+        return True
+
+    def is_unlocked(self, username):
+        return self._request('status', username=username)
+
+    def unlock(self, username, password):
+        self._request('unlock', username=username, password=password)
+
+    def lock(self):
+        self._request('lock')
+
+    def stop(self):
+        self._request('stop')
+
+    def is_password_leaked(self, password):
+        return self._request('leaked', password=password)
+
+    def call(self, username, target, method, arguments):
+        return self._request('call', username=username, target=target, method=method, arguments=list(arguments))
+
+
+class RemoteVaults:
+    def __init__(self, account):
+        self._account = account
+
+    def __getattr__(self, method):
+        if method not in VAULTS_METHODS:
+            raise AttributeError(method)
+
+        def call(*arguments):
+            return self._account.call('vaults', method, arguments)
+        return call
+
+
+class RemoteAccount:
+    def __init__(self, client, username):
+        self._client = client
+        self._username = username
+        self.vaults = RemoteVaults(self)
+
+    def call(self, target, method, arguments):
+        return self._client.call(self._username, target, method, arguments)
+
+    def edit_username(self, new_username):
+        self.call('account', 'edit_username', (new_username,))
+        self._username = new_username
+
+    def edit_password(self, password, confirm_password, progress=None):
+        self.call('account', 'edit_password', (password, confirm_password))
+
+    def delete_user(self):
+        self.call('account', 'delete_user', ())
+
+
+def is_password_leaked(password, client=None):
+    client = client or AgentClient()
+    if client.is_running():
+        return client.is_password_leaked(password)
+    return connection.is_password_leaked(password)
+
+
+def daemonize():
+    pid = os.fork()
+    if pid:
+        os.waitpid(pid, 0)
+        return False
+    os.setsid()
+    if os.fork():
+        os._exit(0)
+    with open(os.devnull, 'r+b') as devnull:
+        for stream in (0, 1, 2):
+            os.dup2(devnull.fileno(), stream)
+    return True
@@ -0,0 +1,113 @@
+import csv
+import itertools
+import json
+import struct
+
+from src import constants
+from src import crypt_utils
+from src.exceptions import ArchiveException
+
+_LENGTH = struct.Struct('<I')
+_CHUNK = struct.Struct('<QB')
+_CSV_NAMES = ['name', 'title']
+_CSV_PASSWORDS = ['password', 'login_password']
+_CSV_DETAILS = [('username', ['username', 'login_username', 'user']), ('url', ['url', 'login_uri', 'website']),
+                ('notes', ['notes', 'note', 'extra', 'comments'])]
+
+
+def _read_exactly(file, size):
+    data = file.read(size)
+    if len(data) != size:
+        raise ArchiveException('archive is truncated')
+    return data
+
+
+def _write_block(file, data):
+    file.write(_LENGTH.pack(len(data)))
+    file.write(data)
+
+
+def _read_block(file):
+    (size,) = _LENGTH.unpack(_read_exactly(file, _LENGTH.size))
+    return _read_exactly(file, size)
+
+
+def is_archive(path):
+    with open(path, 'rb') as file:
+        return file.read(len(constants.ARCHIVE_MAGIC)) == constants.ARCHIVE_MAGIC
+
+
+def write_archive(file, password, entries, policy):
+    (key, salt) = crypt_utils.generate_hash(password, *policy)
+    key_bytes = crypt_utils.byte_string(key)
+    header = json.dumps({'kdf_algorithm': policy[0], 'kdf_params': policy[1], 'salt': salt}).encode('utf-8')
+    file.write(constants.ARCHIVE_MAGIC)
+    _write_block(file, header)
+    entries = iter(entries)
+    count = 0
+    # Each chunk authenticates its position and whether it is the last one, so chunks cannot be dropped or reordered
+    chunk = list(itertools.islice(entries, constants.ARCHIVE_CHUNK_VAULTS))
+    for index in itertools.count():
+        following = list(itertools.islice(entries, constants.ARCHIVE_CHUNK_VAULTS))
+        fields = [field for entry in chunk for field in entry]
+        final = not following
+        sealed = crypt_utils.seal(key_bytes, crypt_utils.pack_fields(fields), header + _CHUNK.pack(index, final))
+        _write_block(file, bytes([final]) + sealed)
+        count += len(chunk)
+        if not following:
+            return count
+        chunk = following
+
+
+def read_archive(file, password):
+    if file.read(len(constants.ARCHIVE_MAGIC)) != constants.ARCHIVE_MAGIC:
+        raise ArchiveException('file is not a PassKeep archive')
+    header = _read_block(file)
+    # The header is only authenticated once the key is derived, so its settings must be bounded before they are used
+    try:
+        settings = json.loads(header.decode('utf-8'))
+        (salt, algorithm, params) = (settings['salt'], settings['kdf_algorithm'], settings['kdf_params'])
+        crypt_utils.check_kdf_params(algorithm, params)
+        crypt_utils.byte_string(salt)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise ArchiveException('archive header is invalid')
+    key = crypt_utils.hash_with_salt(password, salt, algorithm, params)
+    key_bytes = crypt_utils.byte_string(key)
+    for index in itertools.count():
+        block = _read_block(file)
+        if len(block) < 1 + constants.VAULT_RECORD_NONCE_SIZE + constants.VAULT_RECORD_TAG_SIZE:
+            raise ArchiveException('archive chunk is too short')
+        final = bool(block[0])
+        try:
+            packed = crypt_utils.unseal(key_bytes, block[1:], header + _CHUNK.pack(index, final))
+        except ValueError:
+            raise ArchiveException('archive password is incorrect or the archive is corrupted')
+        fields = crypt_utils.unpack_fields(packed)
+        for start in range(0, len(fields), 3):
+            yield tuple(fields[start:start + 3])
+        if final:
+            return
+
+
+def _column(row, names):
+    for name in names:
+        value = row.get(name)
+        if value:
+            return value
+    return ''
+
+
+def read_csv(file):
+    reader = csv.DictReader(file)
+    if reader.fieldnames is None:
+        return
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    if not set(reader.fieldnames) & set(_CSV_PASSWORDS):
+        raise ArchiveException('CSV file has no password column')
+    for row in reader:
+        details = [(label, _column(row, names)) for (label, names) in _CSV_DETAILS]
+        name = _column(row, _CSV_NAMES) or details[1][1]
+        if not name:
+            continue
+        description = '\n'.join('{}: {}'.format(label, value) for (label, value) in details if value)
+        yield name, description, _column(row, _CSV_PASSWORDS)
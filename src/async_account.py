@@ -0,0 +1,252 @@
+import asyncio
+from contextlib import contextmanager
+from concurrent.futures import CancelledError
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import os
+import threading
+
+from src import connection
+from src import constants
+from src import crypt_utils
+from src.account import Account
+from src.agent import VAULTS_METHODS
+from src.connection import Connection
+
+ASYNC_VAULTS_METHODS = VAULTS_METHODS | {'import_vaults'}
+
+_kdf_pool = None
+_kdf_pool_lock = threading.Lock()
+
+
+def kdf_pool():
+    global _kdf_pool
+    with _kdf_pool_lock:
+        if _kdf_pool is None:
+            _kdf_pool = create_kdf_pool()
+        return _kdf_pool
+
+
+def create_kdf_pool(max_workers=None):
+    max_workers = max_workers or min(constants.ASYNC_KDF_MAX_WORKERS, os.cpu_count() or 1)
+    # Forking could copy a sqlite3 lock held by one of the connection threads into the worker
+    return ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=crypt_utils.set_kdf_backend, initargs=(crypt_utils.kdf_backend(),))
+
+
+def shutdown_kdf_pool():
+    global _kdf_pool
+    with _kdf_pool_lock:
+        if _kdf_pool is not None:
+            _kdf_pool.shutdown()
+            _kdf_pool = None
+
+
+class _Kdf:
+    def __init__(self, pool):
+        self._pool = pool
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._future = None
+
+    def start(self, cancelled):
+        with self._lock:
+            self._cancelled = cancelled
+
+    def cancel(self, cancelled):
+        with self._lock:
+            cancelled.set()
+            if self._cancelled is cancelled and self._future is not None:
+                self._future.cancel()
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise CancelledError()
+
+    def __call__(self, function, *arguments):
+        with self._lock:
+            self.check()
+            future = self._future = self._pool.submit(function, *arguments)
+        try:
+            result = future.result()
+        finally:
+            with self._lock:
+                self._future = None
+        self.check()
+        return result
+
+
+class _CancellableConnection(Connection):
+    def __init__(self, path, kdf):
+        super().__init__(path)
+        self._kdf = kdf
+
+    @contextmanager
+    def transaction(self):
+        # A transaction already under way is committed whole, but a cancelled operation never starts another one
+        if not self._in_transaction:
+            self._kdf.check()
+        with super().transaction():
+            yield
+
+
+class _Job(asyncio.Future):
+    def __init__(self, executor_future, on_cancel, loop):
+        super().__init__(loop=loop)
+        self._executor_future = executor_future
+        self._on_cancel = on_cancel
+        executor_future.add_done_callback(self._executor_done)
+
+    def cancel(self, *arguments, **keywords):
+        # A task cancels the future it awaits before it resumes, so the database thread sees the flag at once
+        if not self.done():
+            self._executor_future.cancel()
+            self._on_cancel()
+        return super().cancel(*arguments, **keywords)
+
+    def _executor_done(self, executor_future):
+        loop = self.get_loop()
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self._copy_result, executor_future)
+
+    def _copy_result(self, executor_future):
+        if self.done():
+            return
+        if executor_future.cancelled():
+            super().cancel()
+        elif executor_future.exception() is not None:
+            self.set_exception(executor_future.exception())
+        else:
+            self.set_result(executor_future.result())
+
+
+class _ConnectionThread:
+    def __init__(self, path, pool):
+        # sqlite3 connections may only be used by the thread which created them
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='passkeep-db')
+        self._path = path
+        self._db = None
+        self.kdf = _Kdf(pool)
+
+    def connect(self):
+        if self._db is None:
+            self._db = _CancellableConnection(self._path, self.kdf)
+        return self._db
+
+    def _close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    async def run(self, function, *arguments, timeout=None):
+        cancelled = threading.Event()
+
+        def job():
+            self.kdf.start(cancelled)
+            return function(*arguments)
+        loop = asyncio.get_running_loop()
+        # A queued job never starts, a running one stops at its next key derivation or transaction
+        future = _Job(self._executor.submit(job), lambda: self.kdf.cancel(cancelled), loop)
+        timed_out = []
+
+        def expire():
+            timed_out.append(True)
+            future.cancel()
+        timer = loop.call_later(timeout, expire) if timeout is not None else None
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if timed_out:
+                raise asyncio.TimeoutError() from None
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    async def close(self):
+        await asyncio.wrap_future(self._executor.submit(self._close))
+        self._executor.shutdown(wait=False)
+
+    def abandon(self):
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=False)
+
+
+def _threadsafe(callback):
+    if callback is None:
+        return None
+    loop = asyncio.get_running_loop()
+
+    def call(*arguments):
+        loop.call_soon_threadsafe(callback, *arguments)
+    return call
+
+
+class AsyncVaults:
+    def __init__(self, thread, vaults):
+        self._thread = thread
+        self._vaults = vaults
+
+    def __getattr__(self, method):
+        if method not in ASYNC_VAULTS_METHODS:
+            raise AttributeError(method)
+        function = getattr(self._vaults, method)
+
+        async def call(*arguments, timeout=None):
+            return await self._thread.run(function, *arguments, timeout=timeout)
+        return call
+
+
+class AsyncAccount:
+    def __init__(self, thread, account):
+        self._thread = thread
+        self._account = account
+        self.vaults = AsyncVaults(thread, account.vaults)
+
+    @classmethod
+    async def login(cls, username, password, path=None, timeout=None, pool=None):
+        thread = _ConnectionThread(path, pool or kdf_pool())
+
+        def login():
+            return Account(username, password, thread.connect(), thread.kdf)
+        try:
+            account = await thread.run(login, timeout=timeout)
+        except BaseException:
+            thread.abandon()
+            raise
+        return cls(thread, account)
+
+    @staticmethod
+    async def signup(username, password, confirm_password, path=None, timeout=None, pool=None):
+        thread = _ConnectionThread(path, pool or kdf_pool())
+
+        def signup():
+            Account.signup(username, password, confirm_password, thread.connect(), thread.kdf)
+        try:
+            await thread.run(signup, timeout=timeout)
+        finally:
+            thread.abandon()
+
+    async def edit_username(self, new_username, timeout=None):
+        await self._thread.run(self._account.edit_username, new_username, timeout=timeout)
+
+    async def edit_password(self, password, confirm_password, progress=None, timeout=None):
+        await self._thread.run(self._account.edit_password, password, confirm_password, _threadsafe(progress),
+                               timeout=timeout)
+
+    async def delete_user(self, timeout=None):
+        await self._thread.run(self._account.delete_user, timeout=timeout)
+
+    async def close(self):
+        await self._thread.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+async def is_password_leaked(password):
+    return await asyncio.get_running_loop().run_in_executor(None, connection.is_password_leaked, password)
@@ -0,0 +1,30 @@
+import configparser
+import os
+
+from src import constants
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def resource_path(name):
+    return os.path.join(_ROOT, name)
+
+
+def config_path():
+    config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config')
+    return os.path.join(config_home, constants.CONFIG_DIRECTORY, constants.CONFIG_FILE)
+
+
+def data_dir():
+    directory = os.environ.get(constants.DATA_DIR_ENVIRONMENT)
+    if not directory:
+        parser = configparser.ConfigParser()
+        parser.read(config_path())
+        directory = parser.get(constants.CONFIG_SECTION, 'data_dir', fallback=None)
+    if not directory:
+        return _ROOT
+    return os.path.expanduser(directory)
+
+
+def database_path():
+    return os.path.join(data_dir(), constants.DB_PASSKEEP)
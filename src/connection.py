@@ -1,55 +1,186 @@
+from contextlib import contextmanager
 import hashlib
+import os
+import pathlib
 import secrets
 import sqlite3
+import threading
 
+from src import config
 from src import constants
+from src import leak_filter
+from src import leaked_store
+from src import migrations
+
+
+class _ReferenceDatabase:
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+
+    def _connect(self):
+        uri = pathlib.Path(self._path).resolve().as_uri() + '?mode=ro&immutable=1'
+        db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        db.execute('PRAGMA mmap_size = {}'.format(constants.REFERENCE_MMAP_SIZE))
+        return db
+
+    def _execute(self, statement, arguments):
+        if self._db is None or self._pid != os.getpid():
+            self._db = self._connect()
+            self._pid = os.getpid()
+        return self._db.execute(statement, arguments)
+
+    def query(self, statement, arguments=()):
+        with self._lock:
+            return self._execute(statement, arguments).fetchone()
+
+    def query_all(self, statement, arguments=()):
+        with self._lock:
+            return self._execute(statement, arguments).fetchall()
+
+
+class _OptionalFile:
+    def __init__(self, path, open_file):
+        self._path = path
+        self._open_file = open_file
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded = False
+
+    def get(self):
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                if os.path.exists(self._path):
+                    self._value = self._open_file(self._path)
+        return self._value
+
+
+_leaked_db = _ReferenceDatabase(config.resource_path(constants.DB_LEAKED_PASSWORDS))
+_diceware_db = _ReferenceDatabase(config.resource_path(constants.DB_DICEWARE_WORDS))
+_diceware_words = None
+_leaked_filter = _OptionalFile(config.resource_path(constants.LEAKED_FILTER), leak_filter.BloomFilter)
+_leaked_store = _OptionalFile(config.resource_path(constants.LEAKED_STORE), leaked_store.LeakedStore)
+
+
+def open_reference_databases():
+    if _leaked_store.get() is None:
+        _leaked_filter.get()
+        _leaked_db.query('SELECT password FROM leaked_passwords LIMIT 1')
+    _diceware()
 
 
 def is_password_leaked(password):
-    password = hashlib.sha1(password.encode('utf-8')).hexdigest().upper()
-    db = sqlite3.connect(constants.DB_LEAKED_PASSWORDS)
-    with db:
-        entries = db.execute('SELECT password FROM leaked_passwords WHERE password = ?', (password,)).fetchone()
+    digest = hashlib.sha1(password.encode('utf-8')).digest()
+    store = _leaked_store.get()
+    if store is not None:
+        return digest in store
+    leaked_filter = _leaked_filter.get()
+    if leaked_filter is not None and digest not in leaked_filter:
+        return False
+    password = digest.hex().upper()
+    entries = _leaked_db.query('SELECT password FROM leaked_passwords WHERE password = ?', (password,))
     return bool(entries)
 
 
+def are_passwords_leaked(passwords):
+    digests = [hashlib.sha1(password.encode('utf-8')).digest() for password in passwords]
+    store = _leaked_store.get()
+    if store is not None:
+        return store.contains_many(digests)
+    leaked_filter = _leaked_filter.get()
+    candidates = sorted({digest.hex().upper() for digest in digests
+                         if leaked_filter is None or digest in leaked_filter})
+    leaked = set()
+    for start in range(0, len(candidates), constants.LEAKED_QUERY_BATCH_SIZE):
+        batch = candidates[start:start + constants.LEAKED_QUERY_BATCH_SIZE]
+        statement = 'SELECT password FROM leaked_passwords WHERE password IN ({})'.format(', '.join('?' * len(batch)))
+        leaked.update(row[0] for row in _leaked_db.query_all(statement, batch))
+    return [digest.hex().upper() in leaked for digest in digests]
+
+
+def _diceware():
+    global _diceware_words
+    if _diceware_words is None:
+        words = tuple(row[0] for row in _diceware_db.query_all('SELECT word FROM diceware ORDER BY id'))
+        _diceware_words = (words, frozenset(words))
+    return _diceware_words
+
+
+def diceware_words():
+    return _diceware()[0]
+
+
 def is_diceware_word(word):
-    db = sqlite3.connect(constants.DB_DICEWARE_WORDS)
-    with db:
-        entries = db.execute('SELECT word FROM diceware WHERE word = ?', (word,)).fetchone()
-    return bool(entries)
+    return word in _diceware()[1]
 
 
 def get_random_diceware():
-    random_id = 1 + secrets.randbelow(diceware_list_size())
-    db = sqlite3.connect(constants.DB_DICEWARE_WORDS)
-    with db:
-        entries = db.execute('SELECT word FROM diceware WHERE id = ?', (random_id,)).fetchone()
-    return entries[0]
+    words = diceware_words()
+    return words[secrets.randbelow(len(words))]
 
 
 def diceware_list_size():
-    db = sqlite3.connect(constants.DB_DICEWARE_WORDS)
-    with db:
-        entries = db.execute('SELECT COUNT(word) FROM diceware').fetchone()
-    return entries[0]
+    return len(diceware_words())
 
 
 class Connection:
-    def __init__(self):
-        self._db = sqlite3.connect(constants.DB_PASSKEEP)
+    def __init__(self, path=None):
+        self.path = path or config.database_path()
+        if self.path != constants.DB_MEMORY:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        self._in_transaction = False
+        self._configure()
+        migrations.migrate(self._db)
+
+    def _configure(self):
+        self._db.execute('PRAGMA foreign_keys = ON')
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        self._db.execute('PRAGMA cache_size = -{}'.format(constants.DB_CACHE_SIZE // 1024))
+        self._db.execute('PRAGMA mmap_size = {}'.format(constants.DB_MMAP_SIZE))
+
+    @contextmanager
+    def transaction(self):
+        if self._in_transaction:
+            yield
+            return
+        self._in_transaction = True
+        try:
+            with self._db:
+                yield
+        finally:
+            self._in_transaction = False
 
     def query(self, statement, arguments):
-        with self._db:
+        with self.transaction():
             entries = self._db.execute(statement, arguments).fetchone()
         return entries
 
     def query_all(self, statement, arguments):
-        with self._db:
+        with self.transaction():
             entries = self._db.execute(statement, arguments).fetchall()
         return entries
 
+    def query_iter(self, statement, arguments):
+        with self.transaction():
+            cursor = self._db.execute(statement, arguments)
+            rows = cursor.fetchmany(constants.QUERY_FETCH_SIZE)
+            while rows:
+                yield from rows
+                rows = cursor.fetchmany(constants.QUERY_FETCH_SIZE)
+
     def execute(self, statement, arguments):
-        with self._db:
+        with self.transaction():
             entries = self._db.execute(statement, arguments)
         return entries.lastrowid
+
+    def execute_many(self, statement, arguments):
+        with self.transaction():
+            self._db.executemany(statement, arguments)
+
+    def close(self):
+        self._db.close()
@@ -3,15 +3,91 @@ KEYRING_KEY = 'bkthomps-passkeep'
 DB_LEAKED_PASSWORDS = 'leaked_passwords.db'
 DB_DICEWARE_WORDS = 'diceware.db'
 DB_PASSKEEP = 'passkeep.db'
+LEAKED_FILTER = 'leaked_passwords.bloom'
+LEAKED_FILTER_MAGIC = b'PKBLOOM1'
+LEAKED_FILTER_BITS_PER_ENTRY = 10
+LEAKED_FILTER_HASHES = 7
+LEAKED_STORE = 'leaked_passwords.bin'
+LEAKED_STORE_MAGIC = b'PKLEAKS1'
+LEAKED_STORE_HASH_SIZE = 10
+LEAKED_QUERY_BATCH_SIZE = 500
+REFERENCE_MMAP_SIZE = 256 * 1024 * 1024
+DB_MEMORY = ':memory:'
+DB_CACHE_SIZE = 16 * 1024 * 1024
+DB_MMAP_SIZE = 64 * 1024 * 1024
+QUERY_FETCH_SIZE = 1_000
+
+DATA_DIR_ENVIRONMENT = 'PASSKEEP_DATA_DIR'
+CONFIG_DIRECTORY = 'passkeep'
+CONFIG_FILE = 'config.ini'
+CONFIG_SECTION = 'passkeep'
+
+TRACE_ENVIRONMENT = 'PASSKEEP_TRACE'
+
+AGENT_DIRECTORY = 'passkeep'
+AGENT_SOCKET = 'agent.sock'
+AGENT_IDLE_TIMEOUT = 15 * 60
 
 USERNAME_MAX_LENGTH = 40
 PASSWORD_MIN_LENGTH = 8
 
 GENERATE_PASSWORD_MAX_LENGTH = 250
 GENERATE_DICEWARE_MAX_WORDS = 12
+RANDOM_BLOCK_SIZE = 64 * 1024
 
 SALT_SIZE = 32
 HASH_ROUNDS = 250_000
+KEY_SIZE = 32
+
+KDF_PBKDF2 = 'pbkdf2_sha256'
+KDF_SCRYPT = 'scrypt'
+KDF_DEFAULT_PARAMS = 'rounds={}'.format(HASH_ROUNDS)
+KDF_TEST_PROFILE = (KDF_PBKDF2, 'rounds=1000')
+KDF_BACKEND_HASHLIB = 'hashlib'
+KDF_BACKEND_PASSLIB = 'passlib'
+KDF_BACKEND_ENVIRONMENT = 'PASSKEEP_KDF_BACKEND'
+KDF_CALIBRATION_TARGET = 0.5
+PBKDF2_MIN_ROUNDS = 100_000
+PBKDF2_MAX_ROUNDS = 10_000_000
+PBKDF2_PROBE_ROUNDS = 20_000
+SCRYPT_MIN_COST = 1 << 14
+SCRYPT_BLOCK_SIZE = 8
+SCRYPT_PARALLELISM = 1
+SCRYPT_MAX_PARALLELISM = 16
+SCRYPT_MAX_MEMORY = 256 * 1024 * 1024
+
+KDF_VERSION_LEGACY = 1
+KDF_VERSION_HKDF = 2
+HKDF_AUTH_CONTEXT = b'passkeep-auth'
+HKDF_CRYPT_CONTEXT = b'passkeep-crypt'
+HKDF_NAME_INDEX_CONTEXT = b'passkeep-name-index'
+
+VAULT_RECORD_VERSION = 1
+VAULT_RECORD_NONCE_SIZE = 12
+VAULT_RECORD_TAG_SIZE = 16
+
+IMPORT_BATCH_SIZE = 1_000
+IMPORT_CONFLICT_SKIP = 'skip'
+IMPORT_CONFLICT_OVERWRITE = 'overwrite'
+IMPORT_CONFLICT_RENAME = 'rename'
+ARCHIVE_MAGIC = b'PKARCHV1'
+ARCHIVE_CHUNK_VAULTS = 1_000
+SEARCH_GRAM_SIZE = 2
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_FUZZY_THRESHOLD = 0.5
+
+ASYNC_KDF_MAX_WORKERS = 4
+
+REKEY_BATCH_SIZE = 500
+REKEY_PROGRESS_MIN_VAULTS = 1_000
+
+STRENGTH_BATCH_SIZE = 10_000
+PASSWORD_MIN_ENTROPY = 28
+PATTERN_TOKEN_ENTROPY = 8
+LEAKED_PASSWORD_ENTROPY = 20
+DATE_MIN_YEAR = 1900
+DATE_MAX_YEAR = 2050
+DATE_SEPARATOR_ENTROPY = 2
 
 ENTROPY_PER_CATEGORY = 25
 ENTROPY_CATEGORIES = ['very bad', 'bad', 'reasonable', 'good', 'very good', 'excellent', 'outstanding']
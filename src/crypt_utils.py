@@ -1,9 +1,26 @@
 import base64
-
-from passlib.hash import pbkdf2_sha256
+import hashlib
+import hmac
+import os
+import secrets
+import ssl
+import struct
+import time
+
+from Crypto.Cipher import AES
+from Crypto.Hash import SHA256
+from Crypto.Protocol.KDF import HKDF
 
 from src import constants
 
+try:
+    from passlib.crypto.digest import PBKDF2_BACKENDS
+    from passlib.hash import pbkdf2_sha256
+except ImportError:
+    pbkdf2_sha256 = None
+
+_FIELD_SIZE = struct.Struct('<I')
+
 
 def byte_string(_base64_string):
     return base64.b64decode(_base64_string + '===', b'./')
@@ -13,17 +30,136 @@ def base64_string(_byte_string):
     return base64.b64encode(_byte_string, b'./').decode('utf-8').replace('=', '')
 
 
-def generate_hash(main_key):
-    pair = pbkdf2_sha256.using(rounds=constants.HASH_ROUNDS, salt_size=constants.SALT_SIZE).hash(main_key)
-    salt = pair.split('$')[3]
-    hashed = pair.split('$')[4]
-    return hashed, salt
+def parse_kdf_params(params):
+    return {name: int(value) for (name, value) in (pair.split('=') for pair in params.split(','))}
+
+
+def format_kdf_params(params):
+    return ','.join('{}={}'.format(name, value) for (name, value) in params.items())
+
+
+def _scrypt_memory(n, r, p):
+    return 128 * r * (n + p + 2)
+
+
+def check_kdf_params(algorithm, params):
+    values = parse_kdf_params(params)
+    if algorithm == constants.KDF_PBKDF2 and set(values) == {'rounds'}:
+        if 1 <= values['rounds'] <= constants.PBKDF2_MAX_ROUNDS:
+            return
+    elif algorithm == constants.KDF_SCRYPT and set(values) == {'n', 'r', 'p'}:
+        (n, r, p) = (values['n'], values['r'], values['p'])
+        if (n > 1 and n & (n - 1) == 0 and r >= 1 and 1 <= p <= constants.SCRYPT_MAX_PARALLELISM
+                and _scrypt_memory(n, r, p) <= constants.SCRYPT_MAX_MEMORY):
+            return
+    raise ValueError('key derivation parameters {} are not allowed for {}'.format(params, algorithm))
+
+
+def _pbkdf2_hashlib(main_key, salt_bytes, rounds):
+    return hashlib.pbkdf2_hmac('sha256', main_key.encode('utf-8'), salt_bytes, rounds, constants.KEY_SIZE)
+
+
+def _pbkdf2_passlib(main_key, salt_bytes, rounds):
+    # Kept for comparison with accounts created before the hashlib backend, passlib formats the key with the same
+    # adapted base64 alphabet as base64_string
+    pair = pbkdf2_sha256.using(rounds=rounds, salt=salt_bytes).hash(main_key)
+    return byte_string(pair.split('$')[4])
+
+
+_PBKDF2_BACKENDS = {constants.KDF_BACKEND_HASHLIB: _pbkdf2_hashlib, constants.KDF_BACKEND_PASSLIB: _pbkdf2_passlib}
+_backend = None
+
+
+def kdf_backends():
+    return [name for name in _PBKDF2_BACKENDS if name != constants.KDF_BACKEND_PASSLIB or pbkdf2_sha256]
+
+
+def set_kdf_backend(name):
+    global _backend
+    if name not in kdf_backends():
+        raise ValueError('key derivation backend {} is not available'.format(name))
+    _backend = name
+
+
+def kdf_backend():
+    if _backend is None:
+        set_kdf_backend(os.environ.get(constants.KDF_BACKEND_ENVIRONMENT, constants.KDF_BACKEND_HASHLIB))
+    return _backend
+
+
+def describe_kdf_backend(name):
+    if name == constants.KDF_BACKEND_PASSLIB:
+        return 'passlib, using {}'.format(PBKDF2_BACKENDS[0])
+    return 'hashlib, using {}'.format(ssl.OPENSSL_VERSION)
+
+
+def pbkdf2(main_key, salt_bytes, rounds, backend=None):
+    return _PBKDF2_BACKENDS[backend or kdf_backend()](main_key, salt_bytes, rounds)
+
+
+def _derive(main_key, salt_bytes, algorithm, params):
+    values = parse_kdf_params(params)
+    if algorithm == constants.KDF_PBKDF2:
+        return base64_string(pbkdf2(main_key, salt_bytes, values['rounds']))
+    if algorithm == constants.KDF_SCRYPT:
+        (n, r, p) = (values['n'], values['r'], values['p'])
+        key = hashlib.scrypt(main_key.encode('utf-8'), salt=salt_bytes, n=n, r=r, p=p,
+                             maxmem=_scrypt_memory(n, r, p) + 1024 * 1024, dklen=constants.KEY_SIZE)
+        return base64_string(key)
+    raise ValueError('unknown key derivation algorithm {}'.format(algorithm))
+
 
+def generate_hash(main_key, algorithm=constants.KDF_PBKDF2, params=constants.KDF_DEFAULT_PARAMS):
+    salt_bytes = secrets.token_bytes(constants.SALT_SIZE)
+    return _derive(main_key, salt_bytes, algorithm, params), base64_string(salt_bytes)
 
-def hash_with_salt(main_key, salt):
+
+def hash_with_salt(main_key, salt, algorithm=constants.KDF_PBKDF2, params=constants.KDF_DEFAULT_PARAMS):
+    return _derive(main_key, byte_string(salt), algorithm, params)
+
+
+def time_kdf(algorithm, params):
+    start = time.perf_counter()
+    _derive('calibration', secrets.token_bytes(constants.SALT_SIZE), algorithm, params)
+    return time.perf_counter() - start
+
+
+def calibrate(algorithm, target_seconds=constants.KDF_CALIBRATION_TARGET):
+    if algorithm == constants.KDF_PBKDF2:
+        probe = constants.PBKDF2_PROBE_ROUNDS
+        elapsed = time_kdf(algorithm, format_kdf_params({'rounds': probe}))
+        rounds = int(probe * target_seconds / elapsed) // 1000 * 1000
+        return format_kdf_params({'rounds': min(max(rounds, constants.PBKDF2_MIN_ROUNDS), constants.PBKDF2_MAX_ROUNDS)})
+    if algorithm == constants.KDF_SCRYPT:
+        (r, p) = (constants.SCRYPT_BLOCK_SIZE, constants.SCRYPT_PARALLELISM)
+        n = constants.SCRYPT_MIN_COST
+        elapsed = time_kdf(algorithm, format_kdf_params({'n': n, 'r': r, 'p': p}))
+        # The cost grows linearly with n, which must be a power of two
+        while elapsed * 2 <= target_seconds and _scrypt_memory(n * 2, r, p) <= constants.SCRYPT_MAX_MEMORY:
+            n *= 2
+            elapsed *= 2
+        return format_kdf_params({'n': n, 'r': r, 'p': p})
+    raise ValueError('unknown key derivation algorithm {}'.format(algorithm))
+
+
+def generate_salt():
+    return base64_string(secrets.token_bytes(constants.SALT_SIZE))
+
+
+def expand_keys(master_key, salt):
+    master_bytes = byte_string(master_key)
     salt_bytes = byte_string(salt)
-    pair = pbkdf2_sha256.using(rounds=constants.HASH_ROUNDS, salt=salt_bytes).hash(main_key)
-    return pair.split('$')[4]
+    auth_bytes = HKDF(master_bytes, constants.KEY_SIZE, salt_bytes, SHA256, context=constants.HKDF_AUTH_CONTEXT)
+    crypt_bytes = HKDF(master_bytes, constants.KEY_SIZE, salt_bytes, SHA256, context=constants.HKDF_CRYPT_CONTEXT)
+    return base64_string(auth_bytes), base64_string(crypt_bytes)
+
+
+def derive_subkey(key_bytes, context):
+    return HKDF(key_bytes, constants.KEY_SIZE, b'', SHA256, context=context)
+
+
+def blind_index(index_bytes, value):
+    return base64_string(hmac.new(index_bytes, value.encode('utf-8'), hashlib.sha256).digest())
 
 
 def zero_pad(string):
@@ -31,14 +167,58 @@ def zero_pad(string):
     return string.ljust(len(string) + half_salt_size - len(string) % half_salt_size, '\0')
 
 
-def byte_to_str(byte):
-    return str(byte)[2:][:-1].split('\\x00', 1)[0]
-
-
 def encrypt(cipher, plaintext):
     plaintext_bytes = zero_pad(plaintext).encode()
     return base64_string(cipher.encrypt(plaintext_bytes))
 
 
 def decrypt(cipher, ciphertext):
-    return byte_to_str(cipher.decrypt(byte_string(ciphertext)))
+    return cipher.decrypt(byte_string(ciphertext)).split(b'\0', 1)[0].decode('utf-8')
+
+
+def pack_fields(fields):
+    packed = bytearray()
+    for field in fields:
+        encoded = field.encode('utf-8')
+        packed += _FIELD_SIZE.pack(len(encoded))
+        packed += encoded
+    return bytes(packed)
+
+
+def unpack_fields(packed):
+    fields = []
+    offset = 0
+    while offset < len(packed):
+        (size,) = _FIELD_SIZE.unpack_from(packed, offset)
+        offset += _FIELD_SIZE.size
+        if offset + size > len(packed):
+            raise ValueError('record field is truncated')
+        fields.append(packed[offset:offset + size].decode('utf-8'))
+        offset += size
+    return fields
+
+
+def seal(key_bytes, plaintext, associated_data):
+    cipher = AES.new(key_bytes, AES.MODE_GCM, nonce=secrets.token_bytes(constants.VAULT_RECORD_NONCE_SIZE))
+    cipher.update(associated_data)
+    (ciphertext, tag) = cipher.encrypt_and_digest(plaintext)
+    return cipher.nonce + ciphertext + tag
+
+
+def unseal(key_bytes, sealed, associated_data):
+    nonce_size = constants.VAULT_RECORD_NONCE_SIZE
+    cipher = AES.new(key_bytes, AES.MODE_GCM, nonce=sealed[:nonce_size])
+    cipher.update(associated_data)
+    return cipher.decrypt_and_verify(sealed[nonce_size:-constants.VAULT_RECORD_TAG_SIZE],
+                                     sealed[-constants.VAULT_RECORD_TAG_SIZE:])
+
+
+def encrypt_record(key_bytes, fields, associated_data=b''):
+    header = bytes([constants.VAULT_RECORD_VERSION])
+    return header + seal(key_bytes, pack_fields(fields), header + associated_data)
+
+
+def decrypt_record(key_bytes, record, associated_data=b''):
+    if record[0] != constants.VAULT_RECORD_VERSION:
+        raise ValueError('unknown vault record version {}'.format(record[0]))
+    return unpack_fields(unseal(key_bytes, record[1:], record[:1] + associated_data))
@@ -8,3 +8,15 @@ class AccountException(UserInputException):
 
 class VaultException(AccountException):
     pass
+
+
+class AgentException(UserInputException):
+    pass
+
+
+class DatabaseException(UserInputException):
+    pass
+
+
+class ArchiveException(UserInputException):
+    pass
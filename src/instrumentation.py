@@ -0,0 +1,139 @@
+from contextlib import contextmanager
+from dataclasses import asdict
+from dataclasses import dataclass
+import functools
+import json
+import sys
+import time
+
+from src import connection
+from src import crypt_utils
+from src.connection import Connection
+from src.vaults import Vaults
+
+
+@dataclass
+class Record:
+    calls: int = 0
+    seconds: float = 0.0
+    rows: int = 0
+
+
+_records = {}
+_commits = 0
+_start = None
+_originals = []
+
+
+def _record(name, seconds, rows=0):
+    record = _records.setdefault(name, Record())
+    record.calls += 1
+    record.seconds += seconds
+    record.rows += rows
+
+
+def _timed(name, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _record(name, time.perf_counter() - start)
+    return wrapper
+
+
+def _timed_statement(name, function, count_rows):
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        changes = self._db.total_changes
+        start = time.perf_counter()
+        result = function(self, *args, **kwargs)
+        rows = count_rows(result) if count_rows else self._db.total_changes - changes
+        _record(name, time.perf_counter() - start, rows)
+        return result
+    return wrapper
+
+
+def _counted_transaction(function):
+    @functools.wraps(function)
+    @contextmanager
+    def wrapper(self):
+        global _commits
+        outermost = not self._in_transaction
+        wrote = False
+        with function(self):
+            yield
+            # sqlite3 only opens a transaction for statements which write, so reads do not count as commits
+            wrote = outermost and self._db.in_transaction
+        if wrote:
+            _commits += 1
+    return wrapper
+
+
+def _replace(owner, attribute, wrapper):
+    original = getattr(owner, attribute)
+    setattr(owner, attribute, wrapper)
+    _originals.append((owner, attribute, original))
+    # Modules which imported the function by name hold their own reference to it
+    for module in list(sys.modules.values()):
+        if getattr(module, '__name__', '').startswith('src.') and getattr(module, attribute, None) is original:
+            setattr(module, attribute, wrapper)
+            _originals.append((module, attribute, original))
+
+
+def enable():
+    global _start
+    if _start is not None:
+        return
+    _start = time.perf_counter()
+    for name in ['generate_hash', 'hash_with_salt', 'expand_keys', 'encrypt_record', 'decrypt_record']:
+        _replace(crypt_utils, name, _timed('crypt_utils.' + name, getattr(crypt_utils, name)))
+    for name in ['is_password_leaked', 'are_passwords_leaked', 'is_diceware_word', 'get_random_diceware',
+                 'diceware_words']:
+        _replace(connection, name, _timed('connection.' + name, getattr(connection, name)))
+    _replace(Connection, 'query', _timed_statement('Connection.query', Connection.query, lambda row: int(bool(row))))
+    _replace(Connection, 'query_all', _timed_statement('Connection.query_all', Connection.query_all, len))
+    _replace(Connection, 'execute', _timed_statement('Connection.execute', Connection.execute, None))
+    _replace(Connection, 'execute_many', _timed_statement('Connection.execute_many', Connection.execute_many, None))
+    _replace(Connection, 'transaction', _counted_transaction(Connection.transaction))
+    _replace(Vaults, '_get_vaults', _timed('Vaults.load', Vaults._get_vaults))
+    _replace(Vaults, 'update_vaults_crypt', _timed('Vaults.rekey', Vaults.update_vaults_crypt))
+
+
+def disable():
+    global _start, _commits
+    for (owner, attribute, original) in reversed(_originals):
+        setattr(owner, attribute, original)
+    _originals.clear()
+    _records.clear()
+    _commits = 0
+    _start = None
+
+
+def report():
+    return {
+        'wall_seconds': time.perf_counter() - _start if _start is not None else 0.0,
+        'commits': _commits,
+        'phases': {name: asdict(record) for (name, record) in _records.items()},
+    }
+
+
+def summary():
+    data = report()
+    lines = ['{:<32} {:>8} {:>12} {:>12} {:>8}'.format('phase', 'calls', 'total (ms)', 'mean (us)', 'rows')]
+    phases = sorted(data['phases'].items(), key=lambda item: item[1]['seconds'], reverse=True)
+    for (name, record) in phases:
+        lines.append('{:<32} {:>8} {:>12.3f} {:>12.1f} {:>8}'.format(
+            name, record['calls'], record['seconds'] * 1000, record['seconds'] * 1_000_000 / record['calls'],
+            record['rows']))
+    lines.append('{} commits, {:.3f} ms wall time'.format(data['commits'], data['wall_seconds'] * 1000))
+    return '\n'.join(lines)
+
+
+def write(destination):
+    if destination == '-':
+        print(summary(), file=sys.stderr)
+        return
+    with open(destination, 'w') as file:
+        json.dump(report(), file, indent=2)
@@ -0,0 +1,49 @@
+import math
+import mmap
+import struct
+
+from src import constants
+
+_HEADER = struct.Struct('<8sQI')
+
+
+def _probes(digest, bit_count, hash_count):
+    # The digests are already uniformly distributed, so double hashing on two slices of them is sufficient
+    first = int.from_bytes(digest[:8], 'little')
+    second = int.from_bytes(digest[8:16], 'little') | 1
+    for i in range(hash_count):
+        yield (first + i * second) % bit_count
+
+
+def build(path, digests, count):
+    bit_count = max(8, math.ceil(count * constants.LEAKED_FILTER_BITS_PER_ENTRY / 8) * 8)
+    hash_count = constants.LEAKED_FILTER_HASHES
+    bits = bytearray(bit_count // 8)
+    for digest in digests:
+        for probe in _probes(digest, bit_count, hash_count):
+            bits[probe >> 3] |= 1 << (probe & 7)
+    with open(path, 'wb') as file:
+        file.write(_HEADER.pack(constants.LEAKED_FILTER_MAGIC, bit_count, hash_count))
+        file.write(bits)
+
+
+class BloomFilter:
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self._bit_count, self._hash_count) = _HEADER.unpack_from(self._map)
+        if magic != constants.LEAKED_FILTER_MAGIC:
+            self._map.close()
+            raise ValueError('{} is not a leaked password filter'.format(path))
+        if len(self._map) < _HEADER.size + self._bit_count // 8:
+            self._map.close()
+            raise ValueError('{} is truncated'.format(path))
+
+    def __contains__(self, digest):
+        for probe in _probes(digest, self._bit_count, self._hash_count):
+            if not self._map[_HEADER.size + (probe >> 3)] & (1 << (probe & 7)):
+                return False
+        return True
+
+    def close(self):
+        self._map.close()
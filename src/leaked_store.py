@@ -0,0 +1,93 @@
+import mmap
+import struct
+
+from src import constants
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_HEADER = struct.Struct('<8sIQ')
+_OFFSET = struct.Struct('<Q')
+_PREFIX_COUNT = 1 << 16
+_TABLE_SIZE = (_PREFIX_COUNT + 1) * _OFFSET.size
+
+
+def _prefix(digest):
+    return (digest[0] << 8) | digest[1]
+
+
+def build(path, digests, hash_size=constants.LEAKED_STORE_HASH_SIZE):
+    counts = [0] * _PREFIX_COUNT
+    previous = b''
+    with open(path, 'wb') as file:
+        file.write(b'\0' * (_HEADER.size + _TABLE_SIZE))
+        for digest in digests:
+            record = digest[:hash_size]
+            if record <= previous:
+                if record == previous:
+                    continue
+                raise ValueError('hashes must be sorted in ascending order')
+            previous = record
+            counts[_prefix(record)] += 1
+            file.write(record)
+        offsets = [0]
+        for count in counts:
+            offsets.append(offsets[-1] + count)
+        file.seek(0)
+        file.write(_HEADER.pack(constants.LEAKED_STORE_MAGIC, hash_size, offsets[-1]))
+        file.write(struct.pack('<{}Q'.format(len(offsets)), *offsets))
+    return offsets[-1]
+
+
+class LeakedStore:
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self._hash_size, self._count) = _HEADER.unpack_from(self._map)
+        if magic != constants.LEAKED_STORE_MAGIC:
+            self._map.close()
+            raise ValueError('{} is not a leaked password store'.format(path))
+        self._records = _HEADER.size + _TABLE_SIZE
+        if len(self._map) < self._records + self._count * self._hash_size:
+            self._map.close()
+            raise ValueError('{} is truncated'.format(path))
+        self._array = None
+
+    def __len__(self):
+        return self._count
+
+    def _record(self, index):
+        start = self._records + index * self._hash_size
+        return self._map[start:start + self._hash_size]
+
+    def __contains__(self, digest):
+        record = digest[:self._hash_size]
+        table_entry = _HEADER.size + _prefix(record) * _OFFSET.size
+        (low, high) = struct.unpack_from('<QQ', self._map, table_entry)
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle) < record:
+                low = middle + 1
+            else:
+                high = middle
+        return low < self._count and self._record(low) == record
+
+    def contains_many(self, digests):
+        if numpy is None or not self._count:
+            return [digest in self for digest in digests]
+        if self._array is None:
+            dtype = numpy.dtype('S{}'.format(self._hash_size))
+            self._array = numpy.frombuffer(self._map, dtype=dtype, count=self._count, offset=self._records)
+        queries = numpy.array([digest[:self._hash_size] for digest in digests], dtype=self._array.dtype)
+        if not len(queries):
+            return []
+        indices = numpy.searchsorted(self._array, queries)
+        found = self._array[numpy.minimum(indices, self._count - 1)] == queries
+        found &= indices < self._count
+        return found.tolist()
+
+    def close(self):
+        self._array = None
+        self._map.close()
@@ -1,14 +1,25 @@
+from contextlib import contextmanager
 import argparse
+import csv
 import getpass
+import json
+import os
 import random
 import string
+import sys
+import unicodedata
 
 import pyperclip
 
+from src import agent
+from src import archive
 from src import constants
+from src import crypt_utils
+from src import instrumentation
 from src import password_utils
+from src import pattern_strength
 from src.account import Account
-from src.connection import is_password_leaked
+from src.agent import is_password_leaked
 from src.exceptions import UserInputException
 
 
@@ -21,6 +32,12 @@ def signup(args):
 
 def _login(args):
     username = args.username
+    client = agent.AgentClient()
+    if client.is_running():
+        if not client.is_unlocked(username):
+            password = getpass.getpass('User Password:')
+            client.unlock(username, password)
+        return agent.RemoteAccount(client, username)
     password = getpass.getpass('User Password:')
     return Account(username, password)
 
@@ -39,11 +56,16 @@ def edit_username(args):
     account.edit_username(new_username)
 
 
+def _print_progress(done, total):
+    if total >= constants.REKEY_PROGRESS_MIN_VAULTS:
+        print('  {:.1f}% complete'.format(done * 100 / total))
+
+
 def edit_password(args):
     account = _login(args)
     password = getpass.getpass('User Password:')
     confirm_password = getpass.getpass('Confirm Password:')
-    account.edit_password(password, confirm_password)
+    account.edit_password(password, confirm_password, _print_progress)
 
 
 def delete_user(args):
@@ -53,8 +75,10 @@ def delete_user(args):
 
 
 def vaults(args):
+    if args.offset < 0 or (args.limit is not None and args.limit < 0):
+        raise UserInputException('offset and limit must not be negative')
     account = _login(args)
-    vault_names = account.vaults.get_vault_names()
+    vault_names = account.vaults.get_vault_names(args.prefix, args.offset, args.limit)
     if not vault_names:
         print('No vaults associated with this user')
         return
@@ -63,6 +87,19 @@ def vaults(args):
         print('  {}'.format(vault))
 
 
+def search_vaults(args):
+    if args.limit <= 0:
+        raise UserInputException('limit must be a positive integer')
+    account = _login(args)
+    vault_names = account.vaults.search(args.query, args.limit)
+    if not vault_names:
+        print('No vaults match "{}"'.format(args.query))
+        return
+    print('The matching vaults for this user are:')
+    for vault in vault_names:
+        print('  {}'.format(vault))
+
+
 def get_vault(args):
     account = _login(args)
     (description, password) = account.vaults.get_vault_data(args.name)
@@ -81,6 +118,50 @@ def add_vault(args):
         print('Warning: Password is part of a public data leak, consider changing it')
 
 
+def _login_directly(args):
+    # Exports and imports stream vaults straight through the database rather than through the agent
+    password = getpass.getpass('User Password:')
+    return Account(args.username, password)
+
+
+def _archive_password(confirm):
+    password = getpass.getpass('Archive Password:')
+    if confirm:
+        if password != getpass.getpass('Confirm Archive Password:'):
+            raise UserInputException('archive password does not match confirmation')
+        if len(password) < constants.PASSWORD_MIN_LENGTH:
+            raise UserInputException('archive password must be at least 8 characters')
+    return unicodedata.normalize('NFKD', password)
+
+
+def export_vaults(args):
+    account = _login_directly(args)
+    password = _archive_password(confirm=True)
+    with open(args.output, 'wb') as file:
+        count = archive.write_archive(file, password, account.vaults.iter_vaults(), Account.kdf_policy())
+    print('Exported {} vaults to {}'.format(count, args.output))
+
+
+def import_vaults(args):
+    account = _login_directly(args)
+    if archive.is_archive(args.file):
+        password = _archive_password(confirm=False)
+        file = open(args.file, 'rb')
+        entries = archive.read_archive(file, password)
+    else:
+        file = open(args.file, newline='', encoding='utf-8-sig')
+        entries = archive.read_csv(file)
+    with file:
+        summary = account.vaults.import_vaults(entries, args.conflict)
+    print('Imported {} vaults ({} overwritten, {} renamed, {} skipped)'
+          .format(summary.added + summary.overwritten + summary.renamed, summary.overwritten, summary.renamed,
+                  summary.skipped))
+    client = agent.AgentClient()
+    if client.is_running() and client.is_unlocked(args.username):
+        client.lock()
+        print('The agent has been locked so that it picks up the imported vaults.')
+
+
 def delete_vault(args):
     account = _login(args)
     _confirm('deletion of vault "{}"'.format(args.name))
@@ -107,6 +188,38 @@ def edit_vault_password(args):
         print('Warning: Password is part of a public data leak, consider changing it')
 
 
+def audit(args):
+    account = _login(args)
+    report = account.vaults.audit()
+    if not report:
+        print('No vaults associated with this user')
+        return
+    leaked_count = 0
+    reused_count = 0
+    print('The audit for the vaults of this user is:')
+    for (vault_name, leaked, reused_with) in report:
+        problems = []
+        if leaked:
+            leaked_count += 1
+            problems.append('password is part of a public data leak')
+        if reused_with:
+            reused_count += 1
+            problems.append('password is reused by {}'.format(', '.join(reused_with)))
+        print('  {}: {}'.format(vault_name, '; '.join(problems) if problems else 'ok'))
+    print('{} of {} vaults have leaked passwords, {} reuse a password'.format(leaked_count, len(report), reused_count))
+
+
+@contextmanager
+def _open_output(path):
+    if path is None or path == '-':
+        yield sys.stdout
+        sys.stdout.flush()
+        return
+    # Generated passwords are only readable by the owner, whatever the umask
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as file:
+        yield file
+
+
 def generate(args):
     if args.length <= 0:
         raise UserInputException('length must be a positive integer')
@@ -123,9 +236,16 @@ def generate(args):
         characters += string.ascii_lowercase
     if not characters:
         raise UserInputException('no characters in permitted set')
-    password = password_utils.random_password(characters, args.length)
-    print('The random password has been copied to your clipboard.')
-    pyperclip.copy(password)
+    if args.count <= 0:
+        raise UserInputException('count must be a positive integer')
+    if args.count == 1 and args.output is None:
+        password = password_utils.random_password(characters, args.length)
+        print('The random password has been copied to your clipboard.')
+        pyperclip.copy(password)
+        return
+    with _open_output(args.output) as output:
+        for password in password_utils.random_passwords(characters, args.length, args.count):
+            output.write(password + '\n')
 
 
 def diceware(args):
@@ -135,12 +255,61 @@ def diceware(args):
         raise UserInputException('max words length is {} words'.format(constants.GENERATE_DICEWARE_MAX_WORDS))
     if args.separator not in string.punctuation:
         raise UserInputException('separator is not a special character')
-    password = password_utils.random_diceware(args.separator, args.words)
-    print('The diceware password has been copied to your clipboard.')
-    pyperclip.copy(password)
+    if args.count <= 0:
+        raise UserInputException('count must be a positive integer')
+    if args.count == 1 and args.output is None:
+        password = password_utils.random_diceware(args.separator, args.words)
+        print('The diceware password has been copied to your clipboard.')
+        pyperclip.copy(password)
+        return
+    with _open_output(args.output) as output:
+        for (password, _) in password_utils.random_dicewares(args.separator, args.words, args.count):
+            output.write(password + '\n')
+
+
+def _read_passwords(file):
+    for line in file:
+        password = line.rstrip('\r\n')
+        if password:
+            yield password
 
 
-def strength(_):
+def strength_batch(args):
+    if args.file == '-':
+        passwords = _read_passwords(sys.stdin)
+        input_file = None
+    else:
+        input_file = open(args.file)
+        passwords = _read_passwords(input_file)
+    try:
+        with _open_output(args.output) as output:
+            if args.format == 'csv':
+                writer = csv.writer(output)
+                header = ['password', 'entropy', 'category', 'diceware', 'leaked']
+                writer.writerow(header + ['pattern_entropy'] if args.patterns else header)
+            scores = password_utils.score_passwords(passwords, args.patterns)
+            for (password, entropy, is_diceware, leaked, pattern_entropy) in scores:
+                category = password_utils.entropy_category(entropy)
+                if args.format == 'csv':
+                    row = [password, '{:.2f}'.format(entropy), category, is_diceware, leaked]
+                    if args.patterns:
+                        row.append('{:.2f}'.format(pattern_entropy))
+                    writer.writerow(row)
+                else:
+                    row = {'password': password, 'entropy': round(entropy, 2), 'category': category,
+                           'diceware': is_diceware, 'leaked': leaked}
+                    if args.patterns:
+                        row['pattern_entropy'] = round(pattern_entropy, 2)
+                    output.write(json.dumps(row) + '\n')
+    finally:
+        if input_file:
+            input_file.close()
+
+
+def strength(args):
+    if args.file is not None:
+        strength_batch(args)
+        return
     password_input = getpass.getpass('Password:')
     if not password_input:
         return
@@ -148,18 +317,90 @@ def strength(_):
         raise UserInputException('max password length is {} characters'.format(constants.GENERATE_PASSWORD_MAX_LENGTH))
     password = password_utils.Password(password_input)
     entropy = password.entropy
-    bucket = min(int(entropy / constants.ENTROPY_PER_CATEGORY), len(constants.ENTROPY_CATEGORIES) - 1)
-    category = constants.ENTROPY_CATEGORIES[bucket]
+    category = password_utils.entropy_category(entropy)
     if password.is_diceware:
         print('This diceware password is {} (entropy {:.2f})'.format(category, entropy))
     else:
         print('Assuming it is randomly-generated, this password is {} (entropy {:.2f})'.format(category, entropy))
+    estimate = pattern_strength.estimate(password_input)
+    if estimate.matches:
+        patterns = ', '.join(sorted({match.pattern for match in estimate.matches}))
+        print('Accounting for common patterns ({}), it is {} (entropy {:.2f})'
+              .format(patterns, password_utils.entropy_category(estimate.entropy), estimate.entropy))
+
+
+def start_agent(args):
+    if args.timeout <= 0:
+        raise UserInputException('timeout must be a positive integer')
+    server = agent.AgentServer(idle_timeout=args.timeout)
+    if args.foreground:
+        server.run()
+        return
+    if agent.daemonize():
+        try:
+            server.run()
+        finally:
+            os._exit(0)
+    print('The agent is running in the background.')
+
+
+def lock(_):
+    client = agent.AgentClient()
+    if not client.is_running():
+        raise UserInputException('agent is not running')
+    client.lock()
+    print('All users in the agent have been locked.')
+
+
+def stop_agent(_):
+    client = agent.AgentClient()
+    if not client.is_running():
+        raise UserInputException('agent is not running')
+    client.stop()
+    print('The agent has been stopped.')
+
+
+def calibrate(args):
+    if args.target <= 0:
+        raise UserInputException('target must be a positive number of milliseconds')
+    params = crypt_utils.calibrate(args.algorithm, args.target / 1000)
+    elapsed = crypt_utils.time_kdf(args.algorithm, params)
+    print('Selected {} with {} ({:.0f} ms per unlock on this host)'.format(args.algorithm, params, elapsed * 1000))
+    if args.dry_run:
+        return
+    Account.set_kdf_policy(args.algorithm, params)
+    print('Accounts will be upgraded to these parameters on their next login.')
+
+
+def kdf(_):
+    (algorithm, params) = Account.kdf_policy()
+    print('Key derivation: {} with {}'.format(algorithm, params))
+    print('Active backend: {}'.format(crypt_utils.describe_kdf_backend(crypt_utils.kdf_backend())))
+    print('Available backends: {}'.format(', '.join(crypt_utils.kdf_backends())))
+
+
+def _trace_destination(args):
+    if args.trace_file:
+        return args.trace_file
+    if args.trace:
+        return '-'
+    trace = os.environ.get(constants.TRACE_ENVIRONMENT)
+    if trace in (None, '', '0'):
+        return None
+    if trace == '1':
+        return '-'
+    return trace
 
 
 def main():
     parser = argparse.ArgumentParser(prog='pk',
                                      usage='%(prog)s [options] path',
                                      description='An open-source local password manager.')
+    parser.add_argument('--trace', action='store_true', help='print a timing summary of the command')
+    parser.add_argument('--trace-file', type=str, help='write a JSON timing trace of the command to a file')
+    parser.add_argument('--kdf-backend', choices=crypt_utils.kdf_backends(),
+                        help='library which runs PBKDF2, overriding the {} variable'
+                        .format(constants.KDF_BACKEND_ENVIRONMENT))
     subparsers = parser.add_subparsers()
 
     parser_signup = subparsers.add_parser('signup', help='Create a new account.')
@@ -183,8 +424,19 @@ def main():
 
     parser_vaults = subparsers.add_parser('vaults', help='Access an existing account.')
     parser_vaults.add_argument('--username', '-u', type=str, required=True)
+    parser_vaults.add_argument('--prefix', '-p', type=str, default='',
+                               help='only list vaults whose name starts with it')
+    parser_vaults.add_argument('--offset', type=int, default=0, help='number of vaults to skip')
+    parser_vaults.add_argument('--limit', type=int, default=None, help='maximum number of vaults to list')
     parser_vaults.set_defaults(func=vaults)
 
+    parser_search = subparsers.add_parser('search', help='Search vault names and descriptions.')
+    parser_search.add_argument('--username', '-u', type=str, required=True)
+    parser_search.add_argument('--limit', type=int, default=constants.SEARCH_DEFAULT_LIMIT,
+                               help='maximum number of vaults to list')
+    parser_search.add_argument('query', type=str)
+    parser_search.set_defaults(func=search_vaults)
+
     parser_vault = subparsers.add_parser('vault', help='Operate on a vault.')
     parser_vault_subparsers = parser_vault.add_subparsers()
 
@@ -221,29 +473,86 @@ def main():
     parser_edit_vault_pass.add_argument('--name', '-n', type=str, required=True)
     parser_edit_vault_pass.set_defaults(func=edit_vault_password)
 
+    parser_export = subparsers.add_parser('export', help='Export all vaults to an encrypted archive.')
+    parser_export.add_argument('--username', '-u', type=str, required=True)
+    parser_export.add_argument('--output', '-o', type=str, required=True)
+    parser_export.set_defaults(func=export_vaults)
+
+    parser_import = subparsers.add_parser('import', help='Import vaults from an archive or a CSV export.')
+    parser_import.add_argument('--username', '-u', type=str, required=True)
+    parser_import.add_argument('file', type=str, help='archive from pk export, or CSV from another password manager')
+    conflicts = [constants.IMPORT_CONFLICT_SKIP, constants.IMPORT_CONFLICT_OVERWRITE, constants.IMPORT_CONFLICT_RENAME]
+    parser_import.add_argument('--conflict', choices=conflicts, default=constants.IMPORT_CONFLICT_SKIP,
+                               help='what to do with vaults whose name is already taken')
+    parser_import.set_defaults(func=import_vaults)
+
+    parser_audit = subparsers.add_parser('audit', help='Check every vault password for leaks and reuse.')
+    parser_audit.add_argument('--username', '-u', type=str, required=True)
+    parser_audit.set_defaults(func=audit)
+
     parser_generate = subparsers.add_parser('gen', help='Randomly generate a password.')
     parser_generate.add_argument('--length', '-l', type=int, default=25)
     parser_generate.add_argument('--no-special', action='store_true')
     parser_generate.add_argument('--no-digit', action='store_true')
     parser_generate.add_argument('--no-upper', action='store_true')
     parser_generate.add_argument('--no-lower', action='store_true')
+    parser_generate.add_argument('--count', '-c', type=int, default=1)
+    parser_generate.add_argument('--output', '-o', type=str, help='file to write the passwords to, or - for stdout')
     parser_generate.set_defaults(func=generate)
 
     parser_diceware = subparsers.add_parser('dice', help='Generate a password using the diceware wordlist.')
     parser_diceware.add_argument('--words', '-w', type=int, default=6)
     parser_diceware.add_argument('--separator', '-sep', type=str, default='.')
+    parser_diceware.add_argument('--count', '-c', type=int, default=1)
+    parser_diceware.add_argument('--output', '-o', type=str, help='file to write the passwords to, or - for stdout')
     parser_diceware.set_defaults(func=diceware)
 
     parser_strength = subparsers.add_parser('strength', help='Get the strength of a password.')
+    parser_strength.add_argument('--file', '-f', type=str, help='file with one password per line, or - for stdin')
+    parser_strength.add_argument('--format', choices=['csv', 'json'], default='csv')
+    parser_strength.add_argument('--output', '-o', type=str, help='file to write the scores to, or - for stdout')
+    parser_strength.add_argument('--patterns', action='store_true',
+                                 help='also estimate the entropy accounting for common patterns, which is much slower')
     parser_strength.set_defaults(func=strength)
 
+    parser_agent = subparsers.add_parser('agent', help='Start a background agent which keeps users unlocked.')
+    parser_agent.add_argument('--timeout', '-t', type=int, default=constants.AGENT_IDLE_TIMEOUT,
+                              help='seconds of inactivity after which all users are locked')
+    parser_agent.add_argument('--foreground', action='store_true')
+    parser_agent.set_defaults(func=start_agent)
+
+    parser_lock = subparsers.add_parser('lock', help='Lock all users held by the agent.')
+    parser_lock.set_defaults(func=lock)
+
+    parser_stop = subparsers.add_parser('stop', help='Stop the background agent.')
+    parser_stop.set_defaults(func=stop_agent)
+
+    parser_calibrate = subparsers.add_parser('calibrate', help='Choose key derivation parameters for this host.')
+    parser_calibrate.add_argument('--algorithm', '-a', choices=[constants.KDF_PBKDF2, constants.KDF_SCRYPT],
+                                  default=constants.KDF_PBKDF2)
+    parser_calibrate.add_argument('--target', '-t', type=int, default=int(constants.KDF_CALIBRATION_TARGET * 1000),
+                                  help='target unlock time in milliseconds')
+    parser_calibrate.add_argument('--dry-run', action='store_true', help='print the parameters without saving them')
+    parser_calibrate.set_defaults(func=calibrate)
+
+    parser_kdf = subparsers.add_parser('kdf', help='Show the key derivation policy and backend.')
+    parser_kdf.set_defaults(func=kdf)
+
     arguments = parser.parse_args()
     if getattr(arguments, 'func', None):
+        if arguments.kdf_backend:
+            crypt_utils.set_kdf_backend(arguments.kdf_backend)
+        trace = _trace_destination(arguments)
+        if trace:
+            instrumentation.enable()
         try:
             arguments.func(arguments)
         except UserInputException as e:
             print('Error: ' + str(e))
         except KeyboardInterrupt:
             pass
+        finally:
+            if trace:
+                instrumentation.write(trace)
     else:
         parser.print_help()
@@ -0,0 +1,100 @@
+from src import constants
+from src.exceptions import DatabaseException
+
+
+def _columns(db, table):
+    return [row[1] for row in db.execute('PRAGMA table_info({})'.format(table))]
+
+
+def _add_column(db, table, column, definition):
+    # Databases upgraded before migrations were versioned may already have the column
+    if column not in _columns(db, table):
+        db.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(table, column, definition))
+
+
+def _create_tables(db):
+    db.execute('CREATE TABLE IF NOT EXISTS account ('
+               'username VARCHAR(50) PRIMARY KEY, '
+               'auth_key VARCHAR(50) NOT NULL, '
+               'auth_salt VARCHAR(50) NOT NULL, '
+               'crypt_salt VARCHAR(50) NOT NULL, '
+               'modified DATETIME NOT NULL, '
+               'created DATETIME NOT NULL)')
+    db.execute('CREATE TABLE IF NOT EXISTS vault ('
+               'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+               'iv VARCHAR(25) NOT NULL, '
+               'username VARCHAR(50) NOT NULL, '
+               'vault_name VARCHAR(50) NOT NULL, '
+               'description VARCHAR(500) NOT NULL, '
+               'password VARCHAR(250) NOT NULL, '
+               'modified DATETIME NOT NULL, '
+               'created DATETIME NOT NULL, '
+               'FOREIGN KEY (username) REFERENCES account (username) ON DELETE CASCADE ON UPDATE CASCADE)')
+
+
+def _add_kdf_version(db):
+    _add_column(db, 'account', 'kdf_version', 'INTEGER NOT NULL DEFAULT {}'.format(constants.KDF_VERSION_LEGACY))
+
+
+def _add_kdf_parameters(db):
+    _add_column(db, 'account', 'kdf_algorithm', "VARCHAR(20) NOT NULL DEFAULT '{}'".format(constants.KDF_PBKDF2))
+    _add_column(db, 'account', 'kdf_params', "VARCHAR(50) NOT NULL DEFAULT '{}'".format(constants.KDF_DEFAULT_PARAMS))
+    db.execute('CREATE TABLE IF NOT EXISTS setting (name VARCHAR(50) PRIMARY KEY, value TEXT NOT NULL)')
+
+
+def _add_name_index(db):
+    _add_column(db, 'vault', 'name_index', 'VARCHAR(50)')
+    # Also serves every lookup of the vaults of a user, since username is its leading column
+    db.execute('CREATE UNIQUE INDEX IF NOT EXISTS vault_name_index ON vault (username, name_index)')
+
+
+def _add_vault_record(db):
+    # The encrypted fields are kept until the next login, where the crypt key is available to convert them to a record
+    db.execute('CREATE TABLE vault_record ('
+               'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+               'username VARCHAR(50) NOT NULL, '
+               'name_index VARCHAR(50), '
+               'record BLOB, '
+               'legacy_iv VARCHAR(25), '
+               'legacy_name VARCHAR(50), '
+               'legacy_description VARCHAR(500), '
+               'legacy_password VARCHAR(250), '
+               'modified DATETIME NOT NULL, '
+               'created DATETIME NOT NULL, '
+               'FOREIGN KEY (username) REFERENCES account (username) ON DELETE CASCADE ON UPDATE CASCADE)')
+    db.execute('INSERT INTO vault_record (id, username, name_index, legacy_iv, legacy_name, legacy_description, '
+               'legacy_password, modified, created) '
+               'SELECT id, username, name_index, iv, vault_name, description, password, modified, created FROM vault')
+    db.execute('DROP TABLE vault')
+    db.execute('ALTER TABLE vault_record RENAME TO vault')
+    db.execute('CREATE UNIQUE INDEX vault_name_index ON vault (username, name_index)')
+
+
+MIGRATIONS = [_create_tables, _add_kdf_version, _add_kdf_parameters, _add_name_index, _add_vault_record]
+
+
+def schema_version(db):
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(db):
+    if schema_version(db) == len(MIGRATIONS):
+        return
+    # Rebuilding a table must not check its foreign keys, which databases from before they were enforced may violate
+    foreign_keys = db.execute('PRAGMA foreign_keys').fetchone()[0]
+    db.execute('PRAGMA foreign_keys = OFF')
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        # Another process may have migrated the database while this one waited for the lock
+        version = schema_version(db)
+        if version > len(MIGRATIONS):
+            raise DatabaseException('the database was created by a newer version of PassKeep')
+        for migration in MIGRATIONS[version:]:
+            migration(db)
+        db.execute('PRAGMA user_version = {}'.format(len(MIGRATIONS)))
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        db.execute('PRAGMA foreign_keys = {}'.format(foreign_keys))
@@ -3,21 +3,113 @@ import secrets
 import string
 
 from src import connection
+from src import constants
+from src import pattern_strength
+
+
+def _block_size(needed_bytes):
+    # Twice the bytes needed leaves room for rejected values, so small requests usually need a single draw
+    if needed_bytes is None:
+        return constants.RANDOM_BLOCK_SIZE
+    return min(constants.RANDOM_BLOCK_SIZE, 2 * needed_bytes + 16)
+
+
+def _random_characters(character_set, block_size):
+    size = len(character_set)
+    if size > 256:
+        while True:
+            yield ''.join(character_set[secrets.randbelow(size)] for _ in range(block_size))
+    # Bytes at or above the limit are rejected so that every character is equally likely
+    limit = 256 - 256 % size
+    if all(ord(c) < 128 for c in character_set):
+        table = bytes(ord(character_set[b % size]) if b < limit else 0 for b in range(256))
+        rejected = bytes(range(limit, 256))
+        while True:
+            yield secrets.token_bytes(block_size).translate(table, rejected).decode('ascii')
+    while True:
+        yield ''.join(character_set[b % size] for b in secrets.token_bytes(block_size) if b < limit)
+
+
+def random_passwords(character_set, length, count=None):
+    blocks = _random_characters(character_set, _block_size(None if count is None else length * count))
+    buffer = ''
+    position = 0
+    generated = 0
+    while count is None or generated < count:
+        while len(buffer) - position < length:
+            buffer = buffer[position:] + next(blocks)
+            position = 0
+        yield buffer[position:position + length]
+        position += length
+        generated += 1
 
 
 def random_password(character_set, length):
-    password = ''
-    for i in range(length):
-        random_index = secrets.randbelow(len(character_set))
-        password += character_set[random_index]
-    return password
+    return next(random_passwords(character_set, length, 1))
+
+
+def _random_indices(size, block_size):
+    # Two random bytes per index, rejecting values at or above the limit so that every index is equally likely
+    limit = 65536 - 65536 % size
+    while True:
+        block = memoryview(secrets.token_bytes(block_size)).cast('H')
+        for value in block:
+            if value < limit:
+                yield value % size
+
+
+def random_dicewares(separator, length, count=None):
+    words = connection.diceware_words()
+    entropy = length * math.log2(len(words))
+    indices = _random_indices(len(words), _block_size(None if count is None else 2 * length * count))
+    generated = 0
+    while count is None or generated < count:
+        yield separator.join(words[next(indices)] for _ in range(length)), entropy
+        generated += 1
 
 
 def random_diceware(separator, length):
-    words = []
-    for _ in range(length):
-        words.append(connection.get_random_diceware())
-    return separator.join(words)
+    return next(random_dicewares(separator, length, 1))[0]
+
+
+_PUNCTUATION = frozenset(string.punctuation)
+_CHARACTER_SETS = [frozenset(char_set) for char_set in
+                   (string.ascii_lowercase, string.ascii_uppercase, string.digits, string.punctuation)]
+_ALL_CHARACTERS = frozenset().union(*_CHARACTER_SETS)
+
+
+def character_set_size(password):
+    characters = set(password)
+    size = len(characters - _ALL_CHARACTERS)
+    for char_set in _CHARACTER_SETS:
+        if not characters.isdisjoint(char_set):
+            size += len(char_set)
+    return size
+
+
+def entropy_category(entropy):
+    bucket = min(int(entropy / constants.ENTROPY_PER_CATEGORY), len(constants.ENTROPY_CATEGORIES) - 1)
+    return constants.ENTROPY_CATEGORIES[bucket]
+
+
+def score_passwords(passwords, patterns=False):
+    batch = []
+    for password in passwords:
+        batch.append(password)
+        if len(batch) == constants.STRENGTH_BATCH_SIZE:
+            yield from _score_batch(batch, patterns)
+            batch = []
+    yield from _score_batch(batch, patterns)
+
+
+def _score_batch(passwords, patterns):
+    if not passwords:
+        return
+    for (password, leaked) in zip(passwords, connection.are_passwords_leaked(passwords)):
+        result = Password(password)
+        # The pattern estimate is far slower than the other scores, so it is only computed on request
+        pattern_entropy = pattern_strength.estimate(password, leaked).entropy if patterns else None
+        yield password, result.entropy, result.is_diceware, leaked, pattern_entropy
 
 
 class Password:
@@ -32,7 +124,7 @@ class Password:
     def _is_diceware(password):
         delimiter = None
         for c in password:
-            if c in string.punctuation:
+            if c in _PUNCTUATION:
                 if delimiter and delimiter != c:
                     return False, 0
                 delimiter = c
@@ -46,22 +138,11 @@ class Password:
 
     @staticmethod
     def _entropy_diceware(word_count):
-        return math.log2(connection.diceware_list_size() ** word_count)
+        return word_count * math.log2(connection.diceware_list_size())
 
     @staticmethod
     def _entropy_random(password):
-        character_sets = [string.ascii_lowercase, string.ascii_uppercase, string.digits, string.punctuation]
-        all_characters = ''.join(character_sets)
-        used = set()
-        char_set_size = 0
-        for c in password:
-            if c in all_characters:
-                for char_set in character_sets:
-                    if c in char_set and char_set not in used:
-                        char_set_size += len(char_set)
-                        used.add(char_set)
-                continue
-            if c not in used:
-                char_set_size += 1
-                used.add(c)
-        return math.log2(char_set_size ** len(password))
+        char_set_size = character_set_size(password)
+        if not char_set_size:
+            return 0.0
+        return len(password) * math.log2(char_set_size)
@@ -0,0 +1,237 @@
+from dataclasses import dataclass
+from dataclasses import field
+import math
+import re
+import string
+
+from src import connection
+from src import constants
+from src import password_utils
+
+_KEYBOARD_ROWS = [('`1234567890-=', '~!@#$%^&*()_+'),
+                  ('qwertyuiop[]\\', 'QWERTYUIOP{}|'),
+                  ("asdfghjkl;'", 'ASDFGHJKL:"'),
+                  ('zxcvbnm,./', 'ZXCVBNM<>?')]
+_SHIFTED_KEYS = frozenset(''.join(shifted for (_, shifted) in _KEYBOARD_ROWS))
+_SEQUENCES = [string.ascii_lowercase, string.ascii_uppercase, string.digits]
+_DATE = re.compile(r'(\d{1,4})([ /\\_.-])(\d{1,2})\2(\d{1,4})')
+_REPEAT = re.compile(r'(.+?)\1+')
+
+
+@dataclass
+class Match:
+    pattern: str
+    start: int
+    end: int
+    entropy: float
+
+
+@dataclass
+class Estimate:
+    entropy: float
+    matches: list = field(default_factory=list)
+
+
+class _Indexes:
+    def __init__(self):
+        self.words = connection.diceware_words()
+        self.word_entropy = math.log2(len(self.words))
+        self.trie = {}
+        for word in self.words:
+            node = self.trie
+            for c in word:
+                node = node.setdefault(c, {})
+            node[''] = True
+        self.keyboard = self._keyboard_graph()
+        degrees = [len(neighbours) for neighbours in self.keyboard.values()]
+        self.keyboard_start_entropy = math.log2(len(self.keyboard))
+        self.keyboard_turn_entropy = math.log2(sum(degrees) / len(degrees))
+
+    @staticmethod
+    def _keyboard_graph():
+        keys_at = {}
+        for (row, layers) in enumerate(_KEYBOARD_ROWS):
+            for (layer, keys) in enumerate(layers):
+                for (column, c) in enumerate(keys):
+                    keys_at[(layer, row, column)] = c
+        # Each row is offset by about half a key from the one above it, which gives six neighbours per key
+        directions = [(0, -1), (0, 1), (-1, 0), (-1, 1), (1, -1), (1, 0)]
+        graph = {}
+        for ((layer, row, column), c) in keys_at.items():
+            graph[c] = {}
+            for (direction, (row_offset, column_offset)) in enumerate(directions):
+                neighbour = keys_at.get((layer, row + row_offset, column + column_offset))
+                if neighbour:
+                    graph[c][neighbour] = direction
+        return graph
+
+
+_indexes = None
+
+
+def _get_indexes():
+    global _indexes
+    if _indexes is None:
+        _indexes = _Indexes()
+    return _indexes
+
+
+def _case_entropy(token):
+    upper = sum(1 for c in token if c.isupper())
+    if not upper or token.isupper() or (upper == 1 and token[0].isupper()):
+        return 1.0 if upper else 0.0
+    lower = len(token) - upper
+    return math.log2(sum(_binomial(len(token), i) for i in range(1, min(upper, lower) + 1)))
+
+
+def _binomial(n, k):
+    return math.factorial(n) // (math.factorial(k) * math.factorial(n - k))
+
+
+def _dictionary_matches(password, indexes):
+    lower = password.lower()
+    for start in range(len(lower)):
+        node = indexes.trie
+        for end in range(start, len(lower)):
+            node = node.get(lower[end])
+            if node is None:
+                break
+            if '' in node and end - start >= 2:
+                token = password[start:end + 1]
+                yield Match('dictionary', start, end + 1, indexes.word_entropy + _case_entropy(token))
+
+
+def _keyboard_matches(password, indexes):
+    start = 0
+    turns = 0
+    direction = None
+    for end in range(1, len(password) + 1):
+        if end < len(password):
+            next_direction = indexes.keyboard.get(password[end - 1], {}).get(password[end])
+            if next_direction is not None:
+                if direction is not None and next_direction != direction:
+                    turns += 1
+                direction = next_direction
+                continue
+        if end - start >= 3:
+            shifted = not _SHIFTED_KEYS.isdisjoint(password[start:end])
+            entropy = indexes.keyboard_start_entropy + math.log2(end - start) + turns * indexes.keyboard_turn_entropy
+            yield Match('keyboard', start, end, entropy + (1 if shifted else 0))
+        start = end
+        turns = 0
+        direction = None
+
+
+def _sequence_matches(password):
+    start = 0
+    while start < len(password) - 2:
+        end = start + 1
+        delta = ord(password[end]) - ord(password[start])
+        sequence = next((s for s in _SEQUENCES if password[start] in s), None)
+        if sequence is None or abs(delta) != 1:
+            start += 1
+            continue
+        while end < len(password) and password[end] in sequence and \
+                ord(password[end]) - ord(password[end - 1]) == delta:
+            end += 1
+        if end - start >= 3:
+            entropy = math.log2(len(sequence)) + math.log2(end - start) + (1 if delta < 0 else 0)
+            yield Match('sequence', start, end, entropy)
+        start = max(end - 1, start + 1)
+
+
+def _repeat_matches(password):
+    for match in _REPEAT.finditer(password):
+        base = match.group(1)
+        count = (match.end() - match.start()) // len(base)
+        base_entropy = estimate(base, leaked=False).entropy
+        yield Match('repeat', match.start(), match.end(), base_entropy + math.log2(count))
+
+
+def _is_year(year):
+    return constants.DATE_MIN_YEAR <= year <= constants.DATE_MAX_YEAR
+
+
+def _is_date(day, month, year):
+    return 1 <= day <= 31 and 1 <= month <= 12 and (year < 100 or _is_year(year))
+
+
+def _date_matches(password):
+    year_entropy = math.log2(constants.DATE_MAX_YEAR - constants.DATE_MIN_YEAR + 1)
+    date_entropy = year_entropy + math.log2(31 * 12)
+    for start in range(len(password)):
+        for end in range(start + 4, min(start + 10, len(password)) + 1):
+            token = password[start:end]
+            if token.isdigit():
+                if len(token) == 4 and _is_year(int(token)):
+                    yield Match('date', start, end, year_entropy)
+                elif len(token) in (6, 8) and _is_compact_date(token):
+                    yield Match('date', start, end, date_entropy)
+                continue
+            match = _DATE.fullmatch(token)
+            if match and _is_separated_date(match):
+                yield Match('date', start, end, date_entropy + constants.DATE_SEPARATOR_ENTROPY)
+
+
+def _is_compact_date(token):
+    year_size = len(token) - 4
+    first, second = int(token[:2]), int(token[2:4])
+    if _is_date(first, second, int(token[4:])) or _is_date(second, first, int(token[4:])):
+        return True
+    (year, month, day) = (int(token[:year_size]), int(token[year_size:year_size + 2]), int(token[year_size + 2:]))
+    return _is_date(day, month, year)
+
+
+def _is_separated_date(match):
+    (first, _, second, third) = match.groups()
+    (first, second, third) = (int(first), int(second), int(third))
+    return (_is_date(first, second, third) or _is_date(second, first, third) or
+            (len(match.group(1)) == 4 and _is_date(third, second, first)))
+
+
+def _bruteforce_entropy(password):
+    return math.log2(password_utils.character_set_size(password))
+
+
+def estimate(password, leaked=None):
+    if not password:
+        return Estimate(0.0)
+    if leaked is None:
+        leaked = connection.is_password_leaked(password)
+    if leaked:
+        return Estimate(constants.LEAKED_PASSWORD_ENTROPY,
+                        [Match('leaked', 0, len(password), constants.LEAKED_PASSWORD_ENTROPY)])
+    indexes = _get_indexes()
+    matches_ending = [[] for _ in range(len(password) + 1)]
+    for matcher in (_dictionary_matches(password, indexes), _keyboard_matches(password, indexes),
+                    _sequence_matches(password), _repeat_matches(password), _date_matches(password)):
+        for match in matcher:
+            matches_ending[match.end].append(match)
+    per_character = _bruteforce_entropy(password)
+    token = constants.PATTERN_TOKEN_ENTROPY
+    # Every token after the first, a match or a run of random characters, costs the guesses needed to find where the
+    # tokens start and end, so short matches inside a random string do not undercut guessing it character by character
+    (matched, random_run) = ([0.0] + [math.inf] * len(password), [math.inf] * (len(password) + 1))
+    choice = [None] * (len(password) + 1)
+    for end in range(1, len(password) + 1):
+        random_run[end] = min(random_run[end - 1], matched[end - 1] + (token if end > 1 else 0)) + per_character
+        for match in matches_ending[end]:
+            previous = min(matched[match.start], random_run[match.start])
+            entropy = previous + match.entropy + (token if match.start else 0)
+            if entropy < matched[end]:
+                matched[end] = entropy
+                choice[end] = match
+    matches = []
+    end = len(password)
+    at_match = matched[end] < random_run[end]
+    while end > 0:
+        if not at_match:
+            at_match = matched[end - 1] + (token if end > 1 else 0) < random_run[end - 1]
+            end -= 1
+            continue
+        match = choice[end]
+        matches.append(match)
+        end = match.start
+        at_match = matched[end] <= random_run[end]
+    matches.reverse()
+    return Estimate(min(matched[-1], random_run[-1]), matches)
@@ -0,0 +1,107 @@
+import bisect
+
+from src import constants
+
+
+def _grams(text, padded=True):
+    if padded:
+        text = ' {} '.format(text)
+    size = constants.SEARCH_GRAM_SIZE
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def _add_postings(postings, grams, name):
+    for gram in grams:
+        postings.setdefault(gram, set()).add(name)
+
+
+def _remove_postings(postings, grams, name):
+    for gram in grams:
+        names = postings[gram]
+        names.discard(name)
+        if not names:
+            del postings[gram]
+
+
+class SearchIndex:
+    def __init__(self, vaults):
+        self._texts = {name: '{}\n{}'.format(name, description).casefold() for (name, description) in vaults}
+        self._names = sorted(self._texts)
+        # The n-gram postings are only built once the first search needs them
+        self._name_postings = None
+        self._text_postings = None
+
+    def _postings(self):
+        if self._name_postings is None:
+            self._name_postings = {}
+            self._text_postings = {}
+            for (name, text) in self._texts.items():
+                _add_postings(self._name_postings, _grams(name.casefold()), name)
+                _add_postings(self._text_postings, _grams(text), name)
+        return self._name_postings, self._text_postings
+
+    def add(self, name, description):
+        text = '{}\n{}'.format(name, description).casefold()
+        bisect.insort(self._names, name)
+        self._texts[name] = text
+        if self._name_postings is not None:
+            _add_postings(self._name_postings, _grams(name.casefold()), name)
+            _add_postings(self._text_postings, _grams(text), name)
+
+    def remove(self, name):
+        text = self._texts.pop(name)
+        del self._names[bisect.bisect_left(self._names, name)]
+        if self._name_postings is not None:
+            _remove_postings(self._name_postings, _grams(name.casefold()), name)
+            _remove_postings(self._text_postings, _grams(text), name)
+
+    def names(self, prefix='', offset=0, limit=None):
+        start = bisect.bisect_left(self._names, prefix) + offset
+        end = len(self._names) if limit is None else start + limit
+        names = self._names[start:end]
+        if prefix and names and not names[-1].startswith(prefix):
+            names = [name for name in names if name.startswith(prefix)]
+        return names
+
+    def _candidates(self, query, postings):
+        grams = _grams(query, padded=False)
+        if not grams:
+            return self._texts.keys()
+        return set.intersection(*(postings.get(gram, set()) for gram in grams))
+
+    def _substring_matches(self, query):
+        (_, text_postings) = self._postings()
+        for name in self._candidates(query, text_postings):
+            folded = name.casefold()
+            if folded == query:
+                yield 0, name
+            elif folded.startswith(query):
+                yield 1, name
+            elif query in folded:
+                yield 2, name
+            elif query in self._texts[name]:
+                yield 3, name
+
+    def _fuzzy_matches(self, query, exclude):
+        (name_postings, _) = self._postings()
+        grams = _grams(query)
+        overlaps = {}
+        for gram in grams:
+            for name in name_postings.get(gram, ()):
+                overlaps[name] = overlaps.get(name, 0) + 1
+        for (name, overlap) in overlaps.items():
+            # Dice coefficient between the n-grams of the query and the name
+            score = 2 * overlap / (len(grams) + len(_grams(name.casefold())))
+            if name not in exclude and score >= constants.SEARCH_FUZZY_THRESHOLD:
+                yield score, name
+
+    def search(self, query, limit=constants.SEARCH_DEFAULT_LIMIT):
+        query = query.strip().casefold()
+        if not query:
+            return []
+        matches = sorted(self._substring_matches(query))
+        names = [name for (_, name) in matches[:limit]]
+        if len(names) < limit:
+            fuzzy = sorted(self._fuzzy_matches(query, set(names)), key=lambda match: (-match[0], match[1]))
+            names += [name for (_, name) in fuzzy[:limit - len(names)]]
+        return names
@@ -1,108 +1,298 @@
 from dataclasses import dataclass
 from datetime import datetime
+import itertools
 
 from Crypto.Cipher import AES
 
+from src import constants
 from src import crypt_utils
+from src.connection import are_passwords_leaked
 from src.exceptions import VaultException
+from src.search import SearchIndex
+
+
+@dataclass
+class ImportSummary:
+    added: int = 0
+    overwritten: int = 0
+    renamed: int = 0
+    skipped: int = 0
 
 
 class Vaults:
     @dataclass
     class VaultData:
         id: int
-        iv: object
         description: str
-        password: str
 
     def __init__(self, username, db, crypt_key):
         self._username = username
         self._db = db
-        self._crypt_bytes = crypt_utils.byte_string(crypt_key)
-        self._vaults = self._get_vaults()
+        self._set_crypt_bytes(crypt_utils.byte_string(crypt_key))
+        # Vaults are fetched one at a time through the name index until every vault of the user is needed.
+        # Only names and descriptions are kept, passwords are decrypted again whenever they are asked for
+        self._vaults = {}
+        self._loaded = False
+        self._index = None
+        self._upgrade_legacy_vaults()
+
+    def _set_crypt_bytes(self, crypt_bytes):
+        self._crypt_bytes = crypt_bytes
+        self._index_bytes = crypt_utils.derive_subkey(crypt_bytes, constants.HKDF_NAME_INDEX_CONTEXT)
+
+    def _name_index(self, vault_name):
+        return crypt_utils.blind_index(self._index_bytes, vault_name)
+
+    def _encrypt_record(self, name_index, name, description, password):
+        # Binding the name index detects rows whose indexes were swapped
+        return crypt_utils.encrypt_record(self._crypt_bytes, [name, description, password], name_index.encode('ascii'))
+
+    def _decrypt_legacy(self, iv, encrypted_name, encrypted_description, encrypted_password):
+        # Vaults used to be three fields encrypted in sequence by one CBC cipher
+        cipher = AES.new(self._crypt_bytes, AES.MODE_CBC, iv=iv)
+        return [crypt_utils.decrypt(cipher, field) for field in (encrypted_name, encrypted_description,
+                                                                 encrypted_password)]
+
+    def _upgrade_legacy_vaults(self):
+        statement = ('SELECT id, legacy_iv, legacy_name, legacy_description, legacy_password FROM vault '
+                     'WHERE username = ? AND record IS NULL')
+        rows = self._db.query_all(statement, (self._username,))
+        if not rows:
+            return
+        updates = []
+        for (vault_id, *legacy) in rows:
+            (name, description, password) = self._decrypt_legacy(*legacy)
+            name_index = self._name_index(name)
+            updates.append((self._encrypt_record(name_index, name, description, password), name_index, vault_id))
+        self._db.execute_many('UPDATE vault SET record = ?, name_index = ?, legacy_iv = NULL, legacy_name = NULL, '
+                              'legacy_description = NULL, legacy_password = NULL WHERE id = ?', updates)
+
+    def _decrypt_record(self, name_index, record, crypt_bytes=None):
+        try:
+            return crypt_utils.decrypt_record(crypt_bytes or self._crypt_bytes, record, name_index.encode('ascii'))
+        except ValueError:
+            raise VaultException('vault record is corrupted or does not match its name index')
+
+    def _vault_data(self, row):
+        (vault_id, name_index, record) = row
+        (name, description, password) = self._decrypt_record(name_index, record)
+        return name, self.VaultData(id=vault_id, description=description), password
 
     def _get_vaults(self):
+        rows = self._db.query_all('SELECT id, name_index, record FROM vault WHERE username = ?', (self._username,))
         vaults = {}
-        statement = 'SELECT id, iv, vault_name, description, password FROM vault WHERE username = ?'
-        rows = self._db.query_all(statement, (self._username,))
         for row in rows:
-            (vault_id, vault_iv, encrypted_vault_name, encrypted_description, encrypted_password) = row
-            cipher = AES.new(self._crypt_bytes, AES.MODE_CBC, iv=vault_iv)
-            vault_name = crypt_utils.decrypt(cipher, encrypted_vault_name)
-            description = crypt_utils.decrypt(cipher, encrypted_description)
-            password = crypt_utils.decrypt(cipher, encrypted_password)
-            vault_data = self.VaultData(id=vault_id, iv=vault_iv, description=description, password=password)
-            vaults[vault_name] = vault_data
+            (name, vault, _) = self._vault_data(row)
+            vaults[name] = vault
         return vaults
 
+    def _load_vaults(self):
+        if not self._loaded:
+            vaults = self._get_vaults()
+            vaults.update(self._vaults)
+            self._vaults = vaults
+            self._loaded = True
+        return self._vaults
+
+    def _fetch_vault(self, vault_name):
+        statement = 'SELECT id, name_index, record FROM vault WHERE username = ? AND name_index = ?'
+        row = self._db.query(statement, (self._username, self._name_index(vault_name)))
+        if not row:
+            return None, None
+        (name, vault, password) = self._vault_data(row)
+        if name != vault_name:
+            raise VaultException('vault record does not match its name index')
+        self._vaults[vault_name] = vault
+        return vault, password
+
+    def _find_vault(self, vault_name):
+        if vault_name in self._vaults or self._loaded:
+            return self._vaults.get(vault_name)
+        return self._fetch_vault(vault_name)[0]
+
+    def _get_vault_with_password(self, vault_name):
+        (vault, password) = self._fetch_vault(vault_name)
+        if vault is None:
+            raise VaultException('vault "{}" does not exist for this user'.format(vault_name))
+        return vault, password
+
     def _get_vault(self, vault_name):
-        if vault_name not in self._vaults:
+        vault = self._find_vault(vault_name)
+        if vault is None:
             raise VaultException('vault "{}" does not exist for this user'.format(vault_name))
-        return self._vaults[vault_name]
+        return vault
+
+    def _check_unused(self, vault_name):
+        if self._find_vault(vault_name) is not None:
+            raise VaultException('vault "{}" already exists for this user'.format(vault_name))
+
+    def _search_index(self):
+        if self._index is None:
+            self._index = SearchIndex((name, vault.description) for (name, vault) in self._load_vaults().items())
+        return self._index
 
-    def get_vault_names(self):
-        vault_names = []
-        for key in self._vaults.keys():
-            vault_names.append(key)
-        vault_names.sort()
-        return vault_names
+    def get_vault_names(self, prefix='', offset=0, limit=None):
+        if offset < 0 or (limit is not None and limit < 0):
+            raise VaultException('offset and limit must not be negative')
+        return self._search_index().names(prefix, offset, limit)
+
+    def search(self, query, limit=constants.SEARCH_DEFAULT_LIMIT):
+        return self._search_index().search(query, limit)
 
     def get_vault_data(self, vault_name):
-        vault = self._get_vault(vault_name)
-        return vault.description, vault.password
+        (vault, password) = self._get_vault_with_password(vault_name)
+        return vault.description, password
 
     def add_vault(self, name, description, password):
-        if name in self._vaults:
-            raise VaultException('vault "{}" already exists for this user'.format(name))
-        cipher = AES.new(self._crypt_bytes, AES.MODE_CBC)
-        iv = cipher.IV
-        encrypted_vault_name = crypt_utils.encrypt(cipher, name)
-        encrypted_description = crypt_utils.encrypt(cipher, description)
-        encrypted_password = crypt_utils.encrypt(cipher, password)
+        self._check_unused(name)
         now = datetime.now()
+        name_index = self._name_index(name)
         vault_id = self._db.execute(
-            'INSERT INTO vault (iv, username, vault_name, description, password, modified, created) '
-            'VALUES (?, ?, ?, ?, ?, ?, ?)',
-            (iv, self._username, encrypted_vault_name, encrypted_description, encrypted_password, now, now)
+            'INSERT INTO vault (username, name_index, record, modified, created) VALUES (?, ?, ?, ?, ?)',
+            (self._username, name_index, self._encrypt_record(name_index, name, description, password), now, now)
         )
-        vault_data = self.VaultData(id=vault_id, iv=iv, description=description, password=password)
-        self._vaults[name] = vault_data
+        self._vaults[name] = self.VaultData(id=vault_id, description=description)
+        if self._index is not None:
+            self._index.add(name, description)
 
     def delete_vault(self, vault_name):
         vault = self._get_vault(vault_name)
         self._db.execute('DELETE FROM vault WHERE id = ?', (vault.id,))
         self._vaults.pop(vault_name)
+        if self._index is not None:
+            self._index.remove(vault_name)
 
     def edit_vault_name(self, vault_name, new_name):
-        vault = self._get_vault(vault_name)
-        if new_name in self._vaults:
-            raise VaultException('vault "{}" already exists for this user'.format(new_name))
-        self._edit_vault(vault, new_name, vault.description, vault.password)
+        (vault, password) = self._get_vault_with_password(vault_name)
+        self._check_unused(new_name)
+        self._edit_vault(vault, new_name, vault.description, password)
         self._vaults.pop(vault_name)
         self._vaults[new_name] = vault
+        if self._index is not None:
+            self._index.remove(vault_name)
+            self._index.add(new_name, vault.description)
 
     def edit_vault_description(self, vault_name, new_description):
-        vault = self._get_vault(vault_name)
-        self._edit_vault(vault, vault_name, new_description, vault.password)
+        (vault, password) = self._get_vault_with_password(vault_name)
+        self._edit_vault(vault, vault_name, new_description, password)
         vault.description = new_description
+        if self._index is not None:
+            self._index.remove(vault_name)
+            self._index.add(vault_name, new_description)
 
     def edit_vault_password(self, vault_name, new_password):
         vault = self._get_vault(vault_name)
         self._edit_vault(vault, vault_name, vault.description, new_password)
-        vault.password = new_password
 
     def _edit_vault(self, vault, new_name, new_description, new_password):
-        cipher = AES.new(self._crypt_bytes, AES.MODE_CBC, iv=vault.iv)
-        encrypted_vault_name = crypt_utils.encrypt(cipher, new_name)
-        encrypted_description = crypt_utils.encrypt(cipher, new_description)
-        encrypted_password = crypt_utils.encrypt(cipher, new_password)
-        self._db.execute('UPDATE vault SET vault_name = ?, description = ?, password = ? WHERE id = ?',
-                         (encrypted_vault_name, encrypted_description, encrypted_password, vault.id))
-
-    def update_vaults_crypt(self, crypt_key):
-        self._crypt_bytes = crypt_utils.byte_string(crypt_key)
-        for vault_name, vault in self._vaults.items():
-            self._edit_vault(vault, vault_name, vault.description, vault.password)
+        name_index = self._name_index(new_name)
+        self._db.execute('UPDATE vault SET record = ?, name_index = ?, modified = ? WHERE id = ?',
+                         (self._encrypt_record(name_index, new_name, new_description, new_password), name_index,
+                          datetime.now(), vault.id))
+
+    def update_vaults_crypt(self, crypt_key, progress=None):
+        # Each record is decrypted with the old key right before being encrypted with the new one
+        rows = self._db.query_all('SELECT id, name_index, record FROM vault WHERE username = ?', (self._username,))
+        old_crypt_bytes = self._crypt_bytes
+        self._set_crypt_bytes(crypt_utils.byte_string(crypt_key))
+        done = 0
+        try:
+            with self._db.transaction():
+                for start in range(0, len(rows), constants.REKEY_BATCH_SIZE):
+                    batch = []
+                    for (vault_id, old_name_index, old_record) in rows[start:start + constants.REKEY_BATCH_SIZE]:
+                        (name, description, password) = self._decrypt_record(old_name_index, old_record,
+                                                                             old_crypt_bytes)
+                        name_index = self._name_index(name)
+                        record = self._encrypt_record(name_index, name, description, password)
+                        batch.append((record, name_index, vault_id))
+                    self._db.execute_many('UPDATE vault SET record = ?, name_index = ? WHERE id = ?', batch)
+                    done += len(batch)
+                    if progress:
+                        progress(done, len(rows))
+        except BaseException:
+            self._set_crypt_bytes(old_crypt_bytes)
+            raise
+
+    def iter_vaults(self):
+        statement = 'SELECT name_index, record FROM vault WHERE username = ? ORDER BY id'
+        for (name_index, record) in self._db.query_iter(statement, (self._username,)):
+            yield tuple(self._decrypt_record(name_index, record))
+
+    def _renamed(self, name, used):
+        number = 2
+        while self._name_index('{} ({})'.format(name, number)) in used:
+            number += 1
+        return '{} ({})'.format(name, number)
+
+    def _resolve_conflict(self, name, used, conflict, summary):
+        name_index = self._name_index(name)
+        if name_index not in used:
+            summary.added += 1
+            return name, name_index, False
+        if conflict == constants.IMPORT_CONFLICT_OVERWRITE:
+            summary.overwritten += 1
+            return name, name_index, True
+        if conflict == constants.IMPORT_CONFLICT_RENAME:
+            summary.renamed += 1
+            name = self._renamed(name, used)
+            return name, self._name_index(name), False
+        summary.skipped += 1
+        return None, None, False
+
+    def import_vaults(self, entries, conflict=constants.IMPORT_CONFLICT_SKIP, progress=None):
+        # Conflicts are found through the name indexes, so existing vaults do not need to be decrypted
+        rows = self._db.query_all('SELECT name_index FROM vault WHERE username = ?', (self._username,))
+        used = {row[0] for row in rows}
+        summary = ImportSummary()
+        entries = iter(entries)
+        with self._db.transaction():
+            while True:
+                batch = list(itertools.islice(entries, constants.IMPORT_BATCH_SIZE))
+                if not batch:
+                    break
+                (inserts, updates) = ([], [])
+                now = datetime.now()
+                for (name, description, password) in batch:
+                    (name, name_index, overwrite) = self._resolve_conflict(name, used, conflict, summary)
+                    if name is None:
+                        continue
+                    used.add(name_index)
+                    record = self._encrypt_record(name_index, name, description, password)
+                    if overwrite:
+                        updates.append((record, now, self._username, name_index))
+                    else:
+                        inserts.append((self._username, name_index, record, now, now))
+                self._db.execute_many('INSERT INTO vault (username, name_index, record, modified, created) '
+                                      'VALUES (?, ?, ?, ?, ?)', inserts)
+                self._db.execute_many('UPDATE vault SET record = ?, modified = ? WHERE username = ? AND name_index = ?',
+                                      updates)
+                if progress:
+                    progress(summary)
+        self._vaults = {}
+        self._loaded = False
+        self._index = None
+        return summary
+
+    def audit(self):
+        # Passwords are checked a batch at a time and compared through keyed digests that only live for this audit
+        digest_bytes = crypt_utils.byte_string(crypt_utils.generate_salt())
+        (digests, leaked, reuse) = ({}, {}, {})
+        vaults = self.iter_vaults()
+        while True:
+            batch = list(itertools.islice(vaults, constants.LEAKED_QUERY_BATCH_SIZE))
+            if not batch:
+                break
+            passwords = [password for (_, _, password) in batch]
+            for ((name, _, password), is_leaked) in zip(batch, are_passwords_leaked(passwords)):
+                digests[name] = crypt_utils.blind_index(digest_bytes, password)
+                leaked[name] = is_leaked
+                reuse.setdefault(digests[name], []).append(name)
+        report = []
+        for vault_name in self.get_vault_names():
+            reused_with = [name for name in reuse[digests[vault_name]] if name != vault_name]
+            report.append((vault_name, leaked[vault_name], reused_with))
+        return report
 
     def update_username(self, username):
         self._username = username
@@ -0,0 +1,44 @@
+import hashlib
+import sqlite3
+import pytest
+
+from src import connection
+from src import constants
+from src import leak_filter
+from src import leaked_store
+from src.account import Account
+
+LEAKED_PASSWORDS = ['password', '123456', 'qwerty', 'letmein', 'password1', 'iloveyou', 'Password123!']
+
+
+@pytest.fixture(scope='session')
+def leaked_passwords(tmp_path_factory):
+    # A small leak corpus, so tests do not depend on the full reference database being extracted
+    directory = tmp_path_factory.mktemp('leaked')
+    digests = [hashlib.sha1(password.encode('utf-8')).digest() for password in LEAKED_PASSWORDS]
+    db = sqlite3.connect(str(directory / constants.DB_LEAKED_PASSWORDS))
+    with db:
+        db.execute('CREATE TABLE leaked_passwords (password VARCHAR(50) PRIMARY KEY)')
+        db.executemany('INSERT INTO leaked_passwords (password) VALUES (?)',
+                       [(digest.hex().upper(),) for digest in digests])
+    db.close()
+    leak_filter.build(str(directory / constants.LEAKED_FILTER), digests, len(digests))
+    return directory
+
+
+@pytest.fixture(autouse=True)
+def leaked_databases(leaked_passwords, monkeypatch):
+    monkeypatch.setattr(connection, '_leaked_db',
+                        connection._ReferenceDatabase(str(leaked_passwords / constants.DB_LEAKED_PASSWORDS)))
+    monkeypatch.setattr(connection, '_leaked_filter', connection._OptionalFile(
+        str(leaked_passwords / constants.LEAKED_FILTER), leak_filter.BloomFilter))
+    monkeypatch.setattr(connection, '_leaked_store', connection._OptionalFile(
+        str(leaked_passwords / constants.LEAKED_STORE), leaked_store.LeakedStore))
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    # Every test gets its own database, with a key derivation cheap enough to sign up many accounts
+    monkeypatch.setenv(constants.DATA_DIR_ENVIRONMENT, str(tmp_path))
+    Account.set_kdf_policy(*constants.KDF_TEST_PROFILE)
+    return tmp_path
@@ -1,10 +1,15 @@
 from dataclasses import dataclass
+from datetime import datetime
 import random
 import string
 import pytest
 
+from src import constants
+from src import crypt_utils
 from src.account import Account
 from src.account import AccountException
+from src.connection import Connection
+from src.vaults import Vaults
 from src.vaults import VaultException
 
 
@@ -59,6 +64,11 @@ class TestSignup:
         with pytest.raises(AccountException):
             Account.signup(self.username, password, password)
 
+    def test_guessable_password(self):
+        for password in ['abcdefghijkl', 'aaaaaaaaaaaa', 'qwertyuiop', '11/11/1990', 'qwerty1990']:
+            with pytest.raises(AccountException):
+                Account.signup(self.username, password, password)
+
     def test_bad_login(self):
         Account.signup(self.username, self.password, self.password)
         with pytest.raises(AccountException):
@@ -226,7 +236,8 @@ class TestEditUser(BaseVault):
         self.account.edit_username(new_username)
         with pytest.raises(AccountException):
             Account.signup(new_username, self.password, self.password)
-        Account(new_username, self.password)
+        account = Account(new_username, self.password)
+        assert account.vaults.get_vault_names() == [vault.name for vault in self.vaults]
 
     def test_edit_password(self):
         self._add_vault(self.account)
@@ -245,3 +256,82 @@ class TestEditUser(BaseVault):
         assert vault_name == self.vaults[0].name
         assert description == self.vaults[0].description
         assert password == self.vaults[0].password
+
+
+class TestKdfUpgrade:
+    def setup_method(self):
+        self.username = _random()
+        self.password = _random()
+        auth_key, auth_salt = crypt_utils.generate_hash(self.password, *constants.KDF_TEST_PROFILE)
+        crypt_key, crypt_salt = crypt_utils.generate_hash(self.password, *constants.KDF_TEST_PROFILE)
+        now = datetime.now()
+        db = Connection()
+        db.execute('INSERT INTO account (username, auth_key, auth_salt, crypt_salt, kdf_version, kdf_algorithm, '
+                   'kdf_params, modified, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                   (self.username, auth_key, auth_salt, crypt_salt, constants.KDF_VERSION_LEGACY,
+                    *constants.KDF_TEST_PROFILE, now, now))
+        Vaults(self.username, db, crypt_key).add_vault('name', 'description', 'password')
+        self.legacy_auth_key = auth_key
+
+    def _kdf_version(self):
+        return Connection().query('SELECT kdf_version FROM account WHERE username = ?', (self.username,))[0]
+
+    def test_upgrade_on_login(self):
+        assert self._kdf_version() == constants.KDF_VERSION_LEGACY
+        account = Account(self.username, self.password)
+        assert account.vaults.get_vault_data('name') == ('description', 'password')
+        assert self._kdf_version() == constants.KDF_VERSION_HKDF
+        account = Account(self.username, self.password)
+        assert account.vaults.get_vault_data('name') == ('description', 'password')
+
+    def test_legacy_auth_key_is_not_master_key(self):
+        Account(self.username, self.password)
+        (auth_key, crypt_salt) = Connection().query('SELECT auth_key, crypt_salt FROM account WHERE username = ?',
+                                                    (self.username,))
+        assert crypt_utils.expand_keys(self.legacy_auth_key, crypt_salt)[0] != auth_key
+
+    def test_bad_login_does_not_upgrade(self):
+        with pytest.raises(AccountException):
+            Account(self.username, _random())
+        assert self._kdf_version() == constants.KDF_VERSION_LEGACY
+
+
+class TestKdfPolicy:
+    def setup_method(self):
+        self.username = _random()
+        self.password = _random()
+
+    def _signup(self, algorithm, params):
+        master_key, auth_salt = crypt_utils.generate_hash(self.password, algorithm, params)
+        crypt_salt = crypt_utils.generate_salt()
+        auth_key, crypt_key = crypt_utils.expand_keys(master_key, crypt_salt)
+        now = datetime.now()
+        db = Connection()
+        db.execute('INSERT INTO account (username, auth_key, auth_salt, crypt_salt, kdf_version, kdf_algorithm, '
+                   'kdf_params, modified, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                   (self.username, auth_key, auth_salt, crypt_salt, constants.KDF_VERSION_HKDF, algorithm, params,
+                    now, now))
+        Vaults(self.username, db, crypt_key).add_vault('name', 'description', 'password')
+
+    def _kdf(self):
+        statement = 'SELECT kdf_algorithm, kdf_params FROM account WHERE username = ?'
+        return Connection().query(statement, (self.username,))
+
+    def test_signup_uses_policy(self):
+        Account.signup(self.username, self.password, self.password)
+        assert self._kdf() == Account.kdf_policy()
+
+    def test_upgrade_on_login(self):
+        self._signup(constants.KDF_SCRYPT, crypt_utils.format_kdf_params({'n': 1024, 'r': 8, 'p': 1}))
+        account = Account(self.username, self.password)
+        assert account.vaults.get_vault_data('name') == ('description', 'password')
+        assert self._kdf() == Account.kdf_policy()
+        account = Account(self.username, self.password)
+        assert account.vaults.get_vault_data('name') == ('description', 'password')
+
+    def test_bad_login_does_not_upgrade(self):
+        params = crypt_utils.format_kdf_params({'rounds': 1000})
+        self._signup(constants.KDF_PBKDF2, params)
+        with pytest.raises(AccountException):
+            Account(self.username, _random())
+        assert self._kdf() == (constants.KDF_PBKDF2, params)
@@ -0,0 +1,142 @@
+import os
+import random
+import string
+import tempfile
+import threading
+import time
+import pytest
+
+from src import agent
+from src.account import Account
+from src.exceptions import AccountException
+from src.exceptions import AgentException
+from src.exceptions import VaultException
+
+
+def _random(length=8):
+    return ''.join(random.choice(string.ascii_uppercase) for _ in range(length))
+
+
+class TestAgent:
+    def setup_method(self):
+        self.username = _random()
+        self.password = _random()
+        Account.signup(self.username, self.password, self.password)
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, 'agent.sock')
+        self.server = agent.AgentServer(path, idle_timeout=60)
+        self.thread = threading.Thread(target=self.server.run)
+        self.thread.start()
+        self.client = agent.AgentClient(path)
+
+    def teardown_method(self):
+        self.client.stop()
+        self.thread.join()
+        assert not self.client.is_running()
+        self.directory.cleanup()
+
+    def test_socket_permissions(self):
+        assert self.client.is_running()
+        assert os.stat(self.client.path).st_mode & 0o777 == 0o600
+
+    def test_unlock(self):
+        assert not self.client.is_unlocked(self.username)
+        self.client.unlock(self.username, self.password)
+        assert self.client.is_unlocked(self.username)
+
+    def test_bad_password(self):
+        with pytest.raises(AccountException):
+            self.client.unlock(self.username, _random())
+        assert not self.client.is_unlocked(self.username)
+
+    def test_vaults(self):
+        self.client.unlock(self.username, self.password)
+        account = agent.RemoteAccount(self.client, self.username)
+        account.vaults.add_vault('name', 'description', 'password')
+        assert account.vaults.get_vault_names() == ['name']
+        (description, password) = account.vaults.get_vault_data('name')
+        assert description == 'description'
+        assert password == 'password'
+        with pytest.raises(VaultException):
+            account.vaults.add_vault('name', 'description', 'password')
+        assert Account(self.username, self.password).vaults.get_vault_names() == ['name']
+
+    def test_edit_username(self):
+        self.client.unlock(self.username, self.password)
+        account = agent.RemoteAccount(self.client, self.username)
+        new_username = _random()
+        account.edit_username(new_username)
+        assert not self.client.is_unlocked(self.username)
+        assert self.client.is_unlocked(new_username)
+        assert account.vaults.get_vault_names() == []
+
+    def test_lock(self):
+        self.client.unlock(self.username, self.password)
+        self.client.lock()
+        assert not self.client.is_unlocked(self.username)
+        account = agent.RemoteAccount(self.client, self.username)
+        with pytest.raises(AgentException):
+            account.vaults.get_vault_names()
+
+    def test_handle_timeout(self):
+        self.client.unlock(self.username, self.password)
+        self.server.handle_timeout()
+        assert not self.client.is_unlocked(self.username)
+
+    def test_idle_timeout(self):
+        self.client.stop()
+        self.thread.join()
+        self.server = agent.AgentServer(self.client.path, idle_timeout=0.1)
+        self.thread = threading.Thread(target=self.server.run)
+        self.thread.start()
+        self.client.unlock(self.username, self.password)
+        # Every request restarts the idle period, so polling must be slower than the timeout
+        deadline = time.monotonic() + 10
+        while self.client.is_unlocked(self.username):
+            assert time.monotonic() < deadline
+            time.sleep(0.3)
+
+    def test_leaked(self):
+        assert self.client.is_password_leaked('password')
+        assert not self.client.is_password_leaked(_random(25))
+
+
+class TestSocketPath:
+    def setup_method(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'agent.sock')
+
+    def teardown_method(self):
+        self.directory.cleanup()
+
+    def test_runtime_dir(self, monkeypatch):
+        monkeypatch.setenv('XDG_RUNTIME_DIR', self.directory.name)
+        assert agent.default_socket_path() == os.path.join(self.directory.name, 'passkeep', 'agent.sock')
+
+    def test_open_directory(self):
+        os.chmod(self.directory.name, 0o755)
+        with pytest.raises(AgentException):
+            agent.check_socket_path(self.path)
+        with pytest.raises(AgentException):
+            agent.AgentClient(self.path).unlock(_random(), _random())
+
+    def test_symlinked_directory(self):
+        link = os.path.join(self.directory.name, 'link')
+        os.mkdir(os.path.join(self.directory.name, 'target'), 0o700)
+        os.symlink(os.path.join(self.directory.name, 'target'), link)
+        with pytest.raises(AgentException):
+            agent.check_socket_path(os.path.join(link, 'agent.sock'))
+
+    def test_symlinked_socket(self):
+        os.symlink(os.path.join(self.directory.name, 'elsewhere.sock'), self.path)
+        with pytest.raises(AgentException):
+            agent.check_socket_path(self.path)
+        assert not agent.AgentClient(self.path).is_running()
+
+    def test_foreign_owner(self, monkeypatch):
+        uid = os.getuid()
+        monkeypatch.setattr(os, 'getuid', lambda: uid + 1)
+        with pytest.raises(AgentException):
+            agent.check_socket_path(self.path)
+        with pytest.raises(AgentException):
+            agent.AgentServer(self.path)
@@ -0,0 +1,90 @@
+import io
+import json
+import pytest
+
+from src import archive
+from src import constants
+from src.exceptions import ArchiveException
+
+_ENTRIES = [('name-{}'.format(i), 'description ✓ {}'.format(i), 'pass\0word-{}'.format(i)) for i in range(2_500)]
+
+
+def _write(entries, password='archive-password'):
+    file = io.BytesIO()
+    count = archive.write_archive(file, password, iter(entries), constants.KDF_TEST_PROFILE)
+    assert count == len(entries)
+    return file.getvalue()
+
+
+class TestArchive:
+    def test_round_trip(self):
+        data = _write(_ENTRIES)
+        assert list(archive.read_archive(io.BytesIO(data), 'archive-password')) == _ENTRIES
+
+    def test_empty(self):
+        assert list(archive.read_archive(io.BytesIO(_write([])), 'archive-password')) == []
+
+    def test_wrong_password(self):
+        with pytest.raises(ArchiveException):
+            list(archive.read_archive(io.BytesIO(_write(_ENTRIES)), 'other-password'))
+
+    def test_not_archive(self):
+        with pytest.raises(ArchiveException):
+            list(archive.read_archive(io.BytesIO(b'name,password\n'), 'archive-password'))
+
+    def test_truncated(self):
+        data = _write(_ENTRIES)
+        with pytest.raises(ArchiveException):
+            list(archive.read_archive(io.BytesIO(data[:-100]), 'archive-password'))
+
+    def test_dropped_chunk(self):
+        data = _write(_ENTRIES[:constants.ARCHIVE_CHUNK_VAULTS * 2])
+        first_chunk = data.index(b'}') + 1
+        chunk_size = int.from_bytes(data[first_chunk:first_chunk + 4], 'little') + 4
+        with pytest.raises(ArchiveException):
+            list(archive.read_archive(io.BytesIO(data[:first_chunk] + data[first_chunk + chunk_size:]),
+                                      'archive-password'))
+
+    def test_short_chunk(self):
+        data = _write([])
+        first_chunk = data.index(b'}') + 1
+        for size in range(constants.VAULT_RECORD_NONCE_SIZE + constants.VAULT_RECORD_TAG_SIZE + 1):
+            file = io.BytesIO(data[:first_chunk] + size.to_bytes(4, 'little') + b'\1' * size)
+            with pytest.raises(ArchiveException):
+                list(archive.read_archive(file, 'archive-password'))
+
+    def test_unbounded_kdf(self):
+        headers = [
+            {'kdf_algorithm': constants.KDF_PBKDF2, 'kdf_params': 'rounds=10000000000', 'salt': 'c2FsdA'},
+            {'kdf_algorithm': constants.KDF_SCRYPT, 'kdf_params': 'n=1073741824,r=8,p=1', 'salt': 'c2FsdA'},
+            {'kdf_algorithm': constants.KDF_SCRYPT, 'kdf_params': 'n=1024,r=8,p=1000000', 'salt': 'c2FsdA'},
+            {'kdf_algorithm': 'md5', 'kdf_params': 'rounds=1', 'salt': 'c2FsdA'},
+            {'kdf_algorithm': constants.KDF_PBKDF2, 'kdf_params': 1000, 'salt': 'c2FsdA'},
+            {'kdf_algorithm': constants.KDF_PBKDF2, 'kdf_params': 'rounds=1000'},
+            [],
+        ]
+        for header in headers:
+            data = json.dumps(header).encode('utf-8')
+            file = io.BytesIO(constants.ARCHIVE_MAGIC + len(data).to_bytes(4, 'little') + data)
+            with pytest.raises(ArchiveException):
+                list(archive.read_archive(file, 'archive-password'))
+
+
+class TestCsv:
+    def test_bitwarden(self):
+        file = io.StringIO('folder,favorite,type,name,notes,fields,login_uri,login_username,login_password\n'
+                           ',,login,Mail,some notes,,https://mail.example,alice,secret\n')
+        assert list(archive.read_csv(file)) == [
+            ('Mail', 'username: alice\nurl: https://mail.example\nnotes: some notes', 'secret')]
+
+    def test_keepass(self):
+        file = io.StringIO('"Title","Username","Password","URL","Notes"\n"Bank","bob","hunter2","",""\n')
+        assert list(archive.read_csv(file)) == [('Bank', 'username: bob', 'hunter2')]
+
+    def test_name_from_url(self):
+        file = io.StringIO('url,username,password,extra,name\nhttps://a.example,carol,pw,,\n')
+        assert list(archive.read_csv(file)) == [('https://a.example', 'username: carol\nurl: https://a.example', 'pw')]
+
+    def test_no_password_column(self):
+        with pytest.raises(ArchiveException):
+            list(archive.read_csv(io.StringIO('name,notes\nMail,x\n')))
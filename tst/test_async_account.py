@@ -0,0 +1,171 @@
+import asyncio
+import random
+import string
+import threading
+import time
+import pytest
+
+from src import constants
+from src.account import Account
+from src.async_account import AsyncAccount
+from src.async_account import _ConnectionThread
+from src.async_account import create_kdf_pool
+from src.async_account import is_password_leaked
+from src.connection import Connection
+from src.exceptions import AccountException
+
+SLOW_KDF_PARAMS = 'rounds=3000000'
+
+
+def _random(length=8):
+    return ''.join(random.choice(string.ascii_uppercase) for _ in range(length))
+
+
+class TestAsyncAccount:
+    def setup_method(self):
+        self.pool = create_kdf_pool(2)
+        self.username = _random()
+        self.password = _random(4) + '-' + _random(4) + '-' + _random(4)
+
+    def teardown_method(self):
+        self.pool.shutdown()
+
+    def _run(self, coroutine):
+        return asyncio.run(coroutine)
+
+    async def _signup(self, username=None):
+        await AsyncAccount.signup(username or self.username, self.password, self.password, pool=self.pool)
+
+    async def _login(self, **kwargs):
+        return await AsyncAccount.login(self.username, self.password, pool=self.pool, **kwargs)
+
+    def test_vaults(self):
+        async def test():
+            await self._signup()
+            async with await self._login() as account:
+                await account.vaults.add_vault('name-1', 'description-1', 'password-1')
+                assert await account.vaults.get_vault_names() == ['name-1']
+                assert await account.vaults.get_vault_data('name-1') == ('description-1', 'password-1')
+                assert await account.vaults.search('name') == ['name-1']
+                with pytest.raises(AttributeError):
+                    account.vaults.update_vaults_crypt
+        self._run(test())
+
+    def test_wrong_password(self):
+        async def test():
+            await self._signup()
+            with pytest.raises(AccountException):
+                await AsyncAccount.login(self.username, _random(), pool=self.pool)
+        self._run(test())
+
+    def test_edit_password(self):
+        async def test():
+            await self._signup()
+            async with await self._login() as account:
+                await account.vaults.add_vault('name-1', 'description-1', 'password-1')
+                progress = []
+                await account.edit_password(self.password[::-1], self.password[::-1],
+                                            lambda done, total: progress.append((done, total)))
+                await asyncio.sleep(0)
+                assert progress == [(1, 1)]
+            self.password = self.password[::-1]
+            async with await self._login() as account:
+                assert await account.vaults.get_vault_data('name-1') == ('description-1', 'password-1')
+        self._run(test())
+
+    def test_loop_responsive(self):
+        async def ticker(done, gaps):
+            last = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(0.005)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        async def test():
+            usernames = [_random() for _ in range(8)]
+            await asyncio.gather(*(self._signup(username) for username in usernames))
+            Account.set_kdf_policy(constants.KDF_PBKDF2, 'rounds=200000')
+            (done, gaps) = (asyncio.Event(), [])
+            ticking = asyncio.ensure_future(ticker(done, gaps))
+            start = time.perf_counter()
+            logins = [AsyncAccount.login(username, self.password, pool=self.pool) for username in usernames]
+            accounts = await asyncio.gather(*logins)
+            elapsed = time.perf_counter() - start
+            done.set()
+            await ticking
+            for account in accounts:
+                await account.close()
+            # Every login also re-derives its keys for the new policy, all while the loop keeps ticking. The first
+            # tick also waits for the loop to start the connection threads, which is slow on a loaded host
+            assert max(gaps[1:]) < min(0.1, elapsed / 2)
+        self._run(test())
+
+    def test_login_timeout(self):
+        async def test():
+            await self._signup()
+            Account.set_kdf_policy(constants.KDF_PBKDF2, SLOW_KDF_PARAMS)
+            start = time.perf_counter()
+            with pytest.raises(asyncio.TimeoutError):
+                await self._login(timeout=0.05)
+            assert time.perf_counter() - start < 0.5
+        self._run(test())
+
+    def test_cancel_leaves_account_unchanged(self):
+        async def test():
+            await self._signup()
+            account = await self._login()
+            Account.set_kdf_policy(constants.KDF_PBKDF2, SLOW_KDF_PARAMS)
+            edit = asyncio.ensure_future(account.edit_password(self.password[::-1], self.password[::-1]))
+            await asyncio.sleep(0.05)
+            edit.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await edit
+            # Closing waits for the cancelled operation to stop at its key derivation
+            await account.close()
+            entries = Connection().query('SELECT kdf_params FROM account WHERE username = ?', (self.username,))
+            assert entries == (constants.KDF_TEST_PROFILE[1],)
+            Account.set_kdf_policy(*constants.KDF_TEST_PROFILE)
+            await (await self._login()).close()
+        self._run(test())
+
+    async def _blocked_write(self, timeout=None):
+        thread = _ConnectionThread(None, self.pool)
+        (started, resume) = (threading.Event(), threading.Event())
+
+        def write():
+            started.set()
+            resume.wait()
+            thread.connect().execute('INSERT INTO account (username, auth_key, auth_salt, crypt_salt, modified, '
+                                     "created) VALUES (?, '', '', '', datetime('now'), datetime('now'))",
+                                     (self.username,))
+        job = asyncio.ensure_future(thread.run(write, timeout=timeout))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait)
+        return thread, job, resume
+
+    def _written(self):
+        return Connection().query('SELECT * FROM account WHERE username = ?', (self.username,)) is not None
+
+    def test_cancel_before_write(self):
+        async def test():
+            (thread, job, resume) = await self._blocked_write()
+            job.cancel()
+            resume.set()
+            with pytest.raises(asyncio.CancelledError):
+                await job
+            await thread.close()
+            assert not self._written()
+        self._run(test())
+
+    def test_timeout_before_write(self):
+        async def test():
+            (thread, job, resume) = await self._blocked_write(timeout=0.05)
+            with pytest.raises(asyncio.TimeoutError):
+                await job
+            resume.set()
+            await thread.close()
+            assert not self._written()
+        self._run(test())
+
+    def test_is_password_leaked(self):
+        assert not self._run(is_password_leaked(_random(25)))
@@ -0,0 +1,73 @@
+import os
+import sqlite3
+import threading
+import pytest
+
+from src import config
+from src import connection
+from src import constants
+from src.account import Account
+from src.connection import Connection
+
+
+class TestReferenceDatabases:
+    def test_read_only(self):
+        with pytest.raises(sqlite3.OperationalError):
+            connection._diceware_db.query('DELETE FROM diceware')
+        assert connection.is_diceware_word('lather')
+
+    def test_threads(self):
+        failures = []
+
+        def lookup():
+            for _ in range(100):
+                if not connection.is_password_leaked('password') or not connection.is_diceware_word('igloo'):
+                    failures.append(True)
+        threads = [threading.Thread(target=lookup) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not failures
+
+    def test_diceware_list_size(self):
+        assert connection.diceware_list_size() == 7776
+
+    def test_diceware_words(self):
+        words = connection.diceware_words()
+        assert words is connection.diceware_words()
+        assert words[0] == 'abacus'
+        assert not connection.is_diceware_word('notaword')
+        assert connection.get_random_diceware() in words
+
+    def test_are_passwords_leaked(self):
+        passwords = ['password', 'f75^aD<:V[sY4;$', '123456', 'password']
+        assert connection.are_passwords_leaked(passwords) == [True, False, True, True]
+        assert connection.are_passwords_leaked([]) == []
+
+
+class TestConnection:
+    def test_default_path(self, data_dir):
+        db = Connection()
+        assert db.path == config.database_path() == os.path.join(str(data_dir), constants.DB_PASSKEEP)
+        assert os.path.exists(db.path)
+
+    def test_config_file(self, tmp_path, monkeypatch):
+        monkeypatch.delenv(constants.DATA_DIR_ENVIRONMENT)
+        monkeypatch.setenv('XDG_CONFIG_HOME', str(tmp_path / 'config'))
+        os.makedirs(os.path.dirname(config.config_path()))
+        with open(config.config_path(), 'w') as file:
+            file.write('[{}]\ndata_dir = {}\n'.format(constants.CONFIG_SECTION, tmp_path / 'data'))
+        assert config.data_dir() == str(tmp_path / 'data')
+        Connection()
+        assert os.path.exists(str(tmp_path / 'data' / constants.DB_PASSKEEP))
+
+    def test_memory(self):
+        db = Connection(constants.DB_MEMORY)
+        Account.set_kdf_policy(*constants.KDF_TEST_PROFILE, db)
+        Account.signup('username', 'lather.busybody', 'lather.busybody', db)
+        account = Account('username', 'lather.busybody', db)
+        account.vaults.add_vault('name', 'description', 'password')
+        assert Account('username', 'lather.busybody', db).vaults.get_vault_names() == ['name']
+        assert not Connection(constants.DB_MEMORY).query('SELECT username FROM account', ())
+        assert not Connection().query('SELECT username FROM account', ())
@@ -1,6 +1,8 @@
 import random
 import string
+import pytest
 
+from src import constants
 from src import crypt_utils
 
 
@@ -23,3 +25,89 @@ class TestCryptUtils:
         assert auth_key != self.main_key
         new_auth_key = crypt_utils.hash_with_salt(self.main_key, auth_salt)
         assert new_auth_key == auth_key
+
+    def test_expand_keys(self):
+        master_key, _ = crypt_utils.generate_hash(self.main_key)
+        salt = crypt_utils.generate_salt()
+        auth_key, crypt_key = crypt_utils.expand_keys(master_key, salt)
+        assert auth_key != crypt_key
+        assert auth_key != master_key
+        assert (auth_key, crypt_key) == crypt_utils.expand_keys(master_key, salt)
+        assert (auth_key, crypt_key) != crypt_utils.expand_keys(master_key, crypt_utils.generate_salt())
+
+    def test_scrypt_hash(self):
+        params = crypt_utils.format_kdf_params({'n': 1024, 'r': 8, 'p': 1})
+        auth_key, auth_salt = crypt_utils.generate_hash(self.main_key, constants.KDF_SCRYPT, params)
+        assert crypt_utils.hash_with_salt(self.main_key, auth_salt, constants.KDF_SCRYPT, params) == auth_key
+        assert crypt_utils.hash_with_salt(self.main_key, auth_salt) != auth_key
+        assert len(crypt_utils.byte_string(auth_key)) == constants.KEY_SIZE
+
+    def test_kdf_params(self):
+        params = {'n': 16384, 'r': 8, 'p': 1}
+        assert crypt_utils.parse_kdf_params(crypt_utils.format_kdf_params(params)) == params
+        assert crypt_utils.parse_kdf_params(constants.KDF_DEFAULT_PARAMS) == {'rounds': constants.HASH_ROUNDS}
+
+    def test_calibrate_minimum(self):
+        pbkdf2 = crypt_utils.parse_kdf_params(crypt_utils.calibrate(constants.KDF_PBKDF2, 0.001))
+        scrypt = crypt_utils.parse_kdf_params(crypt_utils.calibrate(constants.KDF_SCRYPT, 0.001))
+        assert pbkdf2['rounds'] == constants.PBKDF2_MIN_ROUNDS
+        assert scrypt['n'] == constants.SCRYPT_MIN_COST
+
+    def test_unknown_algorithm(self):
+        with pytest.raises(ValueError):
+            crypt_utils.hash_with_salt(self.main_key, crypt_utils.generate_salt(), 'md5', 'rounds=1')
+
+    def test_backends_agree(self):
+        salt = crypt_utils.generate_salt()
+        keys = {backend: crypt_utils.pbkdf2(self.main_key + 'é', crypt_utils.byte_string(salt), 1000, backend)
+                for backend in crypt_utils.kdf_backends()}
+        assert len(set(keys.values())) == 1
+
+    def test_existing_passlib_key(self):
+        # Created with passlib before hashlib became the default backend
+        stored = '$pbkdf2-sha256$1000$AwQFBgcICQoLDA0ODxAREhMUFRYXGBkaGxwdHh8gISI$kfqvnEhkwnB70coWgKb0ML3ua1IxCCoRzpPLJ5X0wfE'
+        (rounds, salt, key) = stored.split('$')[2:]
+        assert crypt_utils.hash_with_salt('password', salt, constants.KDF_PBKDF2, 'rounds=' + rounds) == key
+
+    def test_set_backend(self):
+        previous = crypt_utils.kdf_backend()
+        try:
+            for backend in crypt_utils.kdf_backends():
+                crypt_utils.set_kdf_backend(backend)
+                assert crypt_utils.kdf_backend() == backend
+        finally:
+            crypt_utils.set_kdf_backend(previous)
+        with pytest.raises(ValueError):
+            crypt_utils.set_kdf_backend('md5')
+
+    def test_record(self):
+        key = crypt_utils.byte_string(crypt_utils.generate_salt())
+        fields = ['name', '', 'pässword\0' * 100]
+        record = crypt_utils.encrypt_record(key, fields)
+        assert crypt_utils.decrypt_record(key, record) == fields
+        assert crypt_utils.encrypt_record(key, fields) != record
+        with pytest.raises(ValueError):
+            crypt_utils.decrypt_record(crypt_utils.byte_string(crypt_utils.generate_salt()), record)
+        with pytest.raises(ValueError):
+            crypt_utils.decrypt_record(key, bytes([constants.VAULT_RECORD_VERSION + 1]) + record[1:])
+
+    def test_check_kdf_params(self):
+        crypt_utils.check_kdf_params(*constants.KDF_TEST_PROFILE)
+        crypt_utils.check_kdf_params(constants.KDF_SCRYPT, 'n=16384,r=8,p=1')
+        for params in ['n=16383,r=8,p=1', 'n=16384,r=8', 'n=16384,r=0,p=1', 'n=4194304,r=8,p=1']:
+            with pytest.raises(ValueError):
+                crypt_utils.check_kdf_params(constants.KDF_SCRYPT, params)
+        with pytest.raises(ValueError):
+            crypt_utils.check_kdf_params(constants.KDF_PBKDF2, 'rounds={}'.format(constants.PBKDF2_MAX_ROUNDS + 1))
+
+    def test_record_associated_data(self):
+        key = crypt_utils.byte_string(crypt_utils.generate_salt())
+        record = crypt_utils.encrypt_record(key, ['name'], b'index-1')
+        assert crypt_utils.decrypt_record(key, record, b'index-1') == ['name']
+        with pytest.raises(ValueError):
+            crypt_utils.decrypt_record(key, record, b'index-2')
+
+    def test_pack_fields(self):
+        assert crypt_utils.unpack_fields(crypt_utils.pack_fields(['a', '', '✓'])) == ['a', '', '✓']
+        with pytest.raises(ValueError):
+            crypt_utils.unpack_fields(crypt_utils.pack_fields(['abc'])[:-1])
@@ -0,0 +1,89 @@
+from argparse import Namespace
+from datetime import datetime
+import random
+import string
+
+from src import crypt_utils
+from src import constants
+from src import instrumentation
+from src import main
+from src.account import Account
+from src.connection import Connection
+from src.vaults import Vaults
+
+
+def _random(length=8):
+    return ''.join(random.choice(string.ascii_uppercase) for _ in range(length))
+
+
+def _account():
+    username = _random()
+    Connection().execute('INSERT INTO account (username, auth_key, auth_salt, crypt_salt, modified, created) '
+                         'VALUES (?, ?, ?, ?, ?, ?)', (username, '', '', '', datetime.now(), datetime.now()))
+    return username
+
+
+class TestInstrumentation:
+    def setup_method(self):
+        instrumentation.enable()
+
+    def teardown_method(self):
+        instrumentation.disable()
+
+    def test_login(self):
+        username = _random()
+        password = _random()
+        Account.signup(username, password, password)
+        account = Account(username, password)
+        account.vaults.add_vault('name', 'description', 'password')
+        phases = instrumentation.report()['phases']
+        assert phases['crypt_utils.generate_hash']['calls'] == 1
+        assert phases['crypt_utils.hash_with_salt']['calls'] == 1
+        assert phases['crypt_utils.encrypt_record']['calls'] == 1
+        assert phases['connection.is_password_leaked']['calls'] == 1
+        assert 'Vaults.load' not in phases
+        assert phases['Connection.execute']['rows'] == 2
+        assert instrumentation.report()['commits'] >= 2
+        assert 'Connection.execute' in instrumentation.summary()
+
+    def test_rekey(self):
+        vaults = Vaults(_account(), Connection(), crypt_utils.generate_salt())
+        for i in range(3):
+            vaults.add_vault('name-{}'.format(i), 'description', 'password')
+        vaults.get_vault_names()
+        commits = instrumentation.report()['commits']
+        Connection().query_all('SELECT id FROM vault', ())
+        assert instrumentation.report()['commits'] == commits
+        vaults.update_vaults_crypt(crypt_utils.generate_salt())
+        report = instrumentation.report()
+        assert report['commits'] == commits + 1
+        assert report['phases']['Vaults.rekey']['calls'] == 1
+        assert report['phases']['Vaults.load']['calls'] == 1
+        assert report['phases']['Connection.execute_many']['rows'] == 3
+
+    def test_disable(self):
+        instrumentation.disable()
+        assert not hasattr(Connection.query, '__wrapped__')
+        assert not hasattr(crypt_utils.encrypt_record, '__wrapped__')
+        Vaults(_account(), Connection(), crypt_utils.generate_salt())
+        assert instrumentation.report()['phases'] == {}
+
+
+class TestTraceDestination:
+    def _destination(self, monkeypatch, value, **flags):
+        if value is None:
+            monkeypatch.delenv(constants.TRACE_ENVIRONMENT, raising=False)
+        else:
+            monkeypatch.setenv(constants.TRACE_ENVIRONMENT, value)
+        return main._trace_destination(Namespace(trace=flags.get('trace', False), trace_file=flags.get('trace_file')))
+
+    def test_environment(self, monkeypatch):
+        assert self._destination(monkeypatch, None) is None
+        assert self._destination(monkeypatch, '') is None
+        assert self._destination(monkeypatch, '0') is None
+        assert self._destination(monkeypatch, '1') == '-'
+        assert self._destination(monkeypatch, 'trace.json') == 'trace.json'
+
+    def test_flags(self, monkeypatch):
+        assert self._destination(monkeypatch, '0', trace=True) == '-'
+        assert self._destination(monkeypatch, '0', trace_file='trace.json') == 'trace.json'
@@ -0,0 +1,37 @@
+import hashlib
+import os
+import tempfile
+import pytest
+
+from src import leak_filter
+
+
+def _digest(i):
+    return hashlib.sha1(str(i).encode('utf-8')).digest()
+
+
+class TestBloomFilter:
+    def setup_method(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'filter.bloom')
+        self.count = 10_000
+        leak_filter.build(self.path, (_digest(i) for i in range(self.count)), self.count)
+        self.filter = leak_filter.BloomFilter(self.path)
+
+    def teardown_method(self):
+        self.filter.close()
+        self.directory.cleanup()
+
+    def test_no_false_negatives(self):
+        for i in range(self.count):
+            assert _digest(i) in self.filter
+
+    def test_false_positive_rate(self):
+        false_positives = sum(_digest(i) in self.filter for i in range(self.count, 3 * self.count))
+        assert false_positives / (2 * self.count) < 0.02
+
+    def test_bad_file(self):
+        with open(self.path, 'r+b') as file:
+            file.write(b'NOTBLOOM')
+        with pytest.raises(ValueError):
+            leak_filter.BloomFilter(self.path)
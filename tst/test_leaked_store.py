@@ -0,0 +1,48 @@
+import hashlib
+import os
+import tempfile
+import pytest
+
+from src import leaked_store
+
+
+def _digest(i):
+    return hashlib.sha1(str(i).encode('utf-8')).digest()
+
+
+class TestLeakedStore:
+    def setup_method(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'leaked.bin')
+        self.digests = sorted(_digest(i) for i in range(5_000))
+        assert leaked_store.build(self.path, iter(self.digests + self.digests[-1:])) == len(self.digests)
+        self.store = leaked_store.LeakedStore(self.path)
+        self.missing = [_digest(i) for i in range(5_000, 6_000)]
+
+    def teardown_method(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_contains(self):
+        assert len(self.store) == len(self.digests)
+        for digest in self.digests:
+            assert digest in self.store
+        for digest in self.missing:
+            assert digest not in self.store
+
+    def test_contains_many(self):
+        queries = self.missing + self.digests[::7] + [b'\xff' * 20, b'\0' * 20]
+        expected = [digest in self.digests for digest in queries]
+        assert self.store.contains_many(queries) == expected
+
+    def test_contains_many_without_numpy(self):
+        numpy = leaked_store.numpy
+        leaked_store.numpy = None
+        try:
+            assert self.store.contains_many(self.digests[:3] + self.missing[:3]) == [True] * 3 + [False] * 3
+        finally:
+            leaked_store.numpy = numpy
+
+    def test_unsorted(self):
+        with pytest.raises(ValueError):
+            leaked_store.build(self.path, iter(reversed(self.digests)))
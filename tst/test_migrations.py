@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import pytest
+
+from src import constants
+from src import migrations
+from src.connection import Connection
+from src.exceptions import DatabaseException
+
+_BASELINE_SCHEMA = '''
+CREATE TABLE account (
+    username   VARCHAR(50) PRIMARY KEY,
+    auth_key   VARCHAR(50) NOT NULL,
+    auth_salt  VARCHAR(50) NOT NULL,
+    crypt_salt VARCHAR(50) NOT NULL,
+    modified   DATETIME    NOT NULL,
+    created    DATETIME    NOT NULL
+);
+
+CREATE TABLE vault (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    iv          VARCHAR(25)  NOT NULL,
+    username    VARCHAR(50)  NOT NULL,
+    vault_name  VARCHAR(50)  NOT NULL,
+    description VARCHAR(500) NOT NULL,
+    password    VARCHAR(250) NOT NULL,
+    modified    DATETIME     NOT NULL,
+    created     DATETIME     NOT NULL,
+    FOREIGN KEY (username)
+        REFERENCES account (username)
+        ON DELETE CASCADE
+        ON UPDATE CASCADE
+);
+
+INSERT INTO account VALUES ('username', 'auth_key', 'auth_salt', 'crypt_salt', 0, 0);
+INSERT INTO vault VALUES (1, 'iv', 'username', 'name', 'description', 'password', 0, 0);
+'''
+
+
+class TestMigrations:
+    def setup_method(self):
+        self.path = os.path.join(os.environ[constants.DATA_DIR_ENVIRONMENT], 'baseline.db')
+        db = sqlite3.connect(self.path)
+        db.executescript(_BASELINE_SCHEMA)
+        db.close()
+
+    def _pragma(self, db, name):
+        return db.query('PRAGMA {}'.format(name), ())[0]
+
+    def test_upgrade_in_place(self):
+        db = Connection(self.path)
+        assert self._pragma(db, 'user_version') == len(migrations.MIGRATIONS)
+        entries = db.query('SELECT username, kdf_version, kdf_algorithm, kdf_params FROM account', ())
+        assert entries == ('username', constants.KDF_VERSION_LEGACY, constants.KDF_PBKDF2,
+                           constants.KDF_DEFAULT_PARAMS)
+        entries = db.query('SELECT id, legacy_iv, legacy_name, legacy_description, legacy_password, name_index, record '
+                           'FROM vault', ())
+        assert entries == (1, 'iv', 'name', 'description', 'password', None, None)
+        indexes = [row[1] for row in db.query_all('PRAGMA index_list(vault)', ())]
+        assert 'vault_name_index' in indexes
+
+    def test_partially_upgraded(self):
+        db = sqlite3.connect(self.path)
+        db.execute('ALTER TABLE account ADD COLUMN kdf_version INTEGER NOT NULL DEFAULT 1')
+        db.commit()
+        db.close()
+        assert self._pragma(Connection(self.path), 'user_version') == len(migrations.MIGRATIONS)
+
+    def test_idempotent(self):
+        Connection(self.path).execute('UPDATE account SET kdf_version = 2', ())
+        db = Connection(self.path)
+        assert db.query('SELECT kdf_version FROM account', ()) == (2,)
+
+    def test_orphaned_vaults(self):
+        db = sqlite3.connect(self.path)
+        db.execute("INSERT INTO vault VALUES (2, 'iv', 'deleted', 'name', 'description', 'password', 0, 0)")
+        db.commit()
+        db.close()
+        db = Connection(self.path)
+        assert db.query('SELECT COUNT(*) FROM vault', ()) == (2,)
+        assert db.query('PRAGMA foreign_keys', ()) == (1,)
+
+    def test_newer_database(self):
+        db = sqlite3.connect(self.path)
+        db.execute('PRAGMA user_version = {}'.format(len(migrations.MIGRATIONS) + 1))
+        db.close()
+        with pytest.raises(DatabaseException):
+            Connection(self.path)
+
+    def test_pragmas(self):
+        db = Connection(self.path)
+        assert self._pragma(db, 'foreign_keys') == 1
+        assert self._pragma(db, 'journal_mode') == 'wal'
+        assert self._pragma(db, 'synchronous') == 1
+        assert Connection(constants.DB_MEMORY).query('PRAGMA foreign_keys', ()) == (1,)
+
+    def test_cascade(self):
+        db = Connection(self.path)
+        db.execute("UPDATE account SET username = 'renamed'", ())
+        assert db.query('SELECT username FROM vault', ()) == ('renamed',)
+        db.execute('DELETE FROM account', ())
+        assert db.query('SELECT COUNT(*) FROM vault', ()) == (0,)
@@ -1,5 +1,7 @@
+from collections import Counter
 import string
 
+from src import connection
 from src import password_utils
 
 
@@ -77,6 +79,37 @@ class TestGenerateRandom:
         assert 655.5 == self._generate_password(character_set, 100)
 
 
+class TestGenerateBulk:
+    @staticmethod
+    def _chi_square(character_set, passwords):
+        counts = Counter(''.join(passwords))
+        assert set(counts) <= set(character_set)
+        expected = sum(counts.values()) / len(character_set)
+        return sum((counts[c] - expected) ** 2 / expected for c in character_set)
+
+    def test_count(self):
+        passwords = list(password_utils.random_passwords(string.digits, 25, 1000))
+        assert len(passwords) == 1000
+        assert all(len(password) == 25 for password in passwords)
+        assert len(set(passwords)) == 1000
+
+    def test_uniform_digits(self):
+        passwords = password_utils.random_passwords(string.digits, 100, 1000)
+        # Far above the 99.9999th percentile of the chi-square distribution with 9 degrees of freedom
+        assert self._chi_square(string.digits, passwords) < 50
+
+    def test_uniform_all_characters(self):
+        character_set = string.ascii_letters + string.digits + string.punctuation
+        passwords = password_utils.random_passwords(character_set, 100, 5000)
+        # Far above the 99.9999th percentile of the chi-square distribution with 93 degrees of freedom
+        assert self._chi_square(character_set, passwords) < 190
+
+    def test_uniform_non_ascii(self):
+        character_set = 'äöüß'
+        passwords = password_utils.random_passwords(character_set, 100, 500)
+        assert self._chi_square(character_set, passwords) < 40
+
+
 class TestGenerateDiceware:
     def test_smoke(self):
         for i in range(12):
@@ -91,3 +124,40 @@ class TestGenerateDiceware:
                 for c in password:
                     if c != '.':
                         assert c in string.ascii_lowercase
+
+    def test_bulk(self):
+        size = connection.diceware_list_size()
+        results = list(password_utils.random_dicewares('-', 6, 2000))
+        assert len(results) == 2000
+        assert len({password for (password, _) in results}) == 2000
+        for (password, entropy) in results:
+            assert len(password.split('-')) == 6
+            assert all(connection.is_diceware_word(word) for word in password.split('-'))
+            assert round(entropy, 1) == round(password_utils.Password(password).entropy, 1)
+        counts = Counter(word for (password, _) in results for word in password.split('-'))
+        assert len(counts) > 0.7 * size
+        assert max(counts.values()) < 15
+
+
+class TestScorePasswords:
+    def test_scores(self):
+        passwords = ['password', 'lather.busybody', '[-tyZ', '']
+        results = list(password_utils.score_passwords(iter(passwords), patterns=True))
+        assert [password for (password, _, _, _, _) in results] == passwords
+        assert [round(entropy, 1) for (_, entropy, _, _, _) in results] == [37.6, 25.8, 32.0, 0.0]
+        assert [is_diceware for (_, _, is_diceware, _, _) in results] == [False, True, False, False]
+        assert [leaked for (_, _, _, leaked, _) in results] == [True, False, False, False]
+        assert [round(entropy, 1) for (_, _, _, _, entropy) in results] == [20.0, 47.7, 32.0, 0.0]
+        results = list(password_utils.score_passwords(iter(passwords)))
+        assert [entropy for (_, _, _, _, entropy) in results] == [None] * len(passwords)
+
+    def test_many(self):
+        passwords = password_utils.random_passwords(string.ascii_lowercase, 10, 25_000)
+        results = list(password_utils.score_passwords(passwords))
+        assert len(results) == 25_000
+        assert all(round(entropy, 1) == 47.0 for (_, entropy, _, _, _) in results)
+
+    def test_category(self):
+        assert password_utils.entropy_category(0) == 'very bad'
+        assert password_utils.entropy_category(60) == 'reasonable'
+        assert password_utils.entropy_category(1000) == 'outstanding'
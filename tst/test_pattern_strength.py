@@ -0,0 +1,63 @@
+import math
+import random
+import string
+import time
+
+from src import pattern_strength
+
+
+def _patterns(password):
+    return [(match.pattern, password[match.start:match.end]) for match in pattern_strength.estimate(password).matches]
+
+
+class TestPatterns:
+    def test_empty(self):
+        assert pattern_strength.estimate('').entropy == 0
+
+    def test_leaked(self):
+        assert _patterns('Password123!') == [('leaked', 'Password123!')]
+
+    def test_dictionary(self):
+        assert _patterns('lather.busybody') == [('dictionary', 'lather'), ('dictionary', 'busybody')]
+        assert _patterns('BusyBody') == [('dictionary', 'BusyBody')]
+
+    def test_keyboard(self):
+        assert _patterns('qwertyuiop') == [('keyboard', 'qwertyuiop')]
+        assert _patterns('zxcvbnm,./') == [('keyboard', 'zxcvbnm,./')]
+
+    def test_repeat(self):
+        assert _patterns('aaaaaaaaaa') == [('repeat', 'aaaaaaaaaa')]
+        assert _patterns('xkqxkqxkq') == [('repeat', 'xkqxkqxkq')]
+
+    def test_sequence(self):
+        assert _patterns('abcdefgh') == [('sequence', 'abcdefgh')]
+        assert _patterns('98765') == [('sequence', '98765')]
+
+    def test_date(self):
+        assert _patterns('12/05/1990') == [('date', '12/05/1990')]
+        assert ('date', '1987') in _patterns('BusyBody1987')
+
+    def test_random(self):
+        assert _patterns('XKQWNMVBRTLP') == []
+        assert round(pattern_strength.estimate('f75^aD<:V[sY4;$').entropy, 1) == 98.3
+
+    def test_short_patterns_in_random(self):
+        assert _patterns('XKABCQWZ') == []
+        assert _patterns('PMEEXTRV') == []
+        assert round(pattern_strength.estimate('XKABCQWZ').entropy, 1) == round(8 * math.log2(26), 1)
+        assert _patterns('qwerty1990') == [('keyboard', 'qwerty'), ('date', '1990')]
+
+    def test_patterns_lower_entropy(self):
+        assert pattern_strength.estimate('qwertyuiop').entropy < pattern_strength.estimate('qpwoeirutq').entropy
+        assert pattern_strength.estimate('aaaaaaaaaa').entropy < 10
+        assert pattern_strength.estimate('abcdefgh').entropy < 10
+
+    def test_speed(self):
+        characters = string.ascii_letters + string.digits + string.punctuation
+        passwords = [''.join(random.choice(characters) for _ in range(20)) for _ in range(1000)]
+        pattern_strength.estimate(passwords[0], leaked=False)
+        start = time.perf_counter()
+        for password in passwords:
+            pattern_strength.estimate(password, leaked=False)
+        # Only guards against pathological slowdowns, make bench measures the actual speed
+        assert (time.perf_counter() - start) / len(passwords) < 0.02
@@ -1,9 +1,14 @@
+from datetime import datetime
 import random
 import string
 import pytest
 
+from Crypto.Cipher import AES
+
+from src import constants
 from src import crypt_utils
 from src.connection import Connection
+from src.vaults import ImportSummary
 from src.vaults import Vaults
 from src.vaults import VaultException
 
@@ -12,10 +17,17 @@ def _random(length=8):
     return ''.join(random.choice(string.ascii_uppercase) for _ in range(length))
 
 
+def _account():
+    username = _random()
+    Connection().execute('INSERT INTO account (username, auth_key, auth_salt, crypt_salt, modified, created) '
+                         'VALUES (?, ?, ?, ?, ?, ?)', (username, '', '', '', datetime.now(), datetime.now()))
+    return username
+
+
 class BaseTestVaults:
     def setup_method(self):
-        self.username = _random()
-        self.crypt_key = crypt_utils.generate_hash(_random())[0]
+        self.username = _account()
+        self.crypt_key = crypt_utils.generate_salt()
         self.vaults = Vaults(self.username, Connection(), self.crypt_key)
         assert len(self.vaults.get_vault_names()) == 0
         self.vaults.add_vault('name-1', 'description-1', 'password-1')
@@ -117,8 +129,8 @@ class TestEditVaultPassword(BaseTestVaults):
 
 class TestException:
     def setup_method(self):
-        self.username = _random()
-        self.crypt_key = crypt_utils.generate_hash(_random())[0]
+        self.username = _account()
+        self.crypt_key = crypt_utils.generate_salt()
         self.vaults = Vaults(self.username, Connection(), self.crypt_key)
         self.vaults.add_vault('name', 'description', 'password')
 
@@ -145,3 +157,286 @@ class TestException:
     def test_edit_vault_password(self):
         with pytest.raises(VaultException):
             self.vaults.edit_vault_password('name-1', 'password-1')
+
+
+class TestRecords:
+    def setup_method(self):
+        self.username = _account()
+        self.crypt_key = crypt_utils.generate_salt()
+        vaults = Vaults(self.username, Connection(), self.crypt_key)
+        vaults.add_vault('name-1', 'description-1', 'password-1')
+        vaults.add_vault('name-2', 'description-2', 'password-2')
+        self.vaults = Vaults(self.username, Connection(), self.crypt_key)
+
+    def _records(self):
+        statement = 'SELECT record FROM vault WHERE username = ? ORDER BY id'
+        return [row[0] for row in Connection().query_all(statement, (self.username,))]
+
+    def test_unicode_and_nul(self):
+        name = 'naïve \0 名前'
+        self.vaults.add_vault(name, '', 'pass\0word ✓' * 50)
+        vaults = Vaults(self.username, Connection(), self.crypt_key)
+        assert vaults.get_vault_data(name) == ('', 'pass\0word ✓' * 50)
+        assert name in vaults.get_vault_names()
+
+    def test_fresh_nonce(self):
+        records = self._records()
+        self.vaults.edit_vault_description('name-1', 'description-1')
+        assert self._records()[0] != records[0]
+        assert self._records()[1] == records[1]
+
+    def test_tampered(self):
+        record = bytearray(self._records()[0])
+        record[-1] ^= 1
+        Connection().execute('UPDATE vault SET record = ? WHERE username = ? AND id = (SELECT MIN(id) FROM vault '
+                             'WHERE username = ?)', (bytes(record), self.username, self.username))
+        with pytest.raises(VaultException):
+            Vaults(self.username, Connection(), self.crypt_key).get_vault_data('name-1')
+
+    def test_edit_reencrypts(self):
+        self.vaults.edit_vault_name('name-1', 'new-name-1')
+        vaults = Vaults(self.username, Connection(), self.crypt_key)
+        assert vaults.get_vault_data('new-name-1') == ('description-1', 'password-1')
+
+    def test_update_vaults_crypt(self):
+        crypt_key = crypt_utils.generate_salt()
+        self.vaults.update_vaults_crypt(crypt_key)
+        vaults = Vaults(self.username, Connection(), crypt_key)
+        assert vaults.get_vault_data('name-1') == ('description-1', 'password-1')
+        assert vaults.get_vault_data('name-2') == ('description-2', 'password-2')
+
+
+class TestNameIndex:
+    def setup_method(self):
+        self.username = _account()
+        self.crypt_key = crypt_utils.generate_salt()
+        self.vaults = Vaults(self.username, Connection(), self.crypt_key)
+        self.vaults.add_vault('name-1', 'description-1', 'password-1')
+        self.vaults.add_vault('name-2', 'description-2', 'password-2')
+
+    def _name_indexes(self):
+        statement = 'SELECT name_index FROM vault WHERE username = ? ORDER BY id'
+        return [row[0] for row in Connection().query_all(statement, (self.username,))]
+
+    def test_single_row(self):
+        vaults = Vaults(self.username, Connection(), self.crypt_key)
+        assert vaults.get_vault_data('name-1') == ('description-1', 'password-1')
+        vaults.edit_vault_name('name-1', 'name-3')
+        vaults.delete_vault('name-2')
+        with pytest.raises(VaultException):
+            vaults.get_vault_data('name-1')
+        assert not vaults._loaded
+        assert Vaults(self.username, Connection(), self.crypt_key).get_vault_names() == ['name-3']
+
+    def test_duplicate_name(self):
+        vaults = Vaults(self.username, Connection(), self.crypt_key)
+        with pytest.raises(VaultException):
+            vaults.add_vault('name-2', 'description', 'password')
+        with pytest.raises(VaultException):
+            vaults.edit_vault_name('name-1', 'name-2')
+        assert not vaults._loaded
+
+    def test_passwords_not_cached(self):
+        vaults = Vaults(self.username, Connection(), self.crypt_key)
+        assert vaults.get_vault_data('name-1') == ('description-1', 'password-1')
+        vaults.add_vault('name-3', 'description-3', 'password-3')
+        vaults.edit_vault_password('name-2', 'password-4')
+        assert vaults.search('name') and vaults.audit()
+        assert vaults._loaded
+        assert all(not hasattr(vault, 'password') for vault in vaults._vaults.values())
+        assert vaults.get_vault_data('name-2') == ('description-2', 'password-4')
+
+    def test_keyed_by_crypt_key(self):
+        other = Vaults(_account(), Connection(), crypt_utils.generate_salt())
+        other.add_vault('name-1', 'description-1', 'password-1')
+        assert other._name_index('name-1') != self.vaults._name_index('name-1')
+        indexes = self._name_indexes()
+        self.vaults.update_vaults_crypt(crypt_utils.generate_salt())
+        assert set(indexes).isdisjoint(self._name_indexes())
+
+    def _add_legacy_vault(self, name, description, password):
+        cipher = AES.new(crypt_utils.byte_string(self.crypt_key), AES.MODE_CBC)
+        legacy = [crypt_utils.encrypt(cipher, field) for field in (name, description, password)]
+        Connection().execute('INSERT INTO vault (username, legacy_iv, legacy_name, legacy_description, '
+                             'legacy_password, modified, created) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (self.username, cipher.IV, *legacy, datetime.now(), datetime.now()))
+
+    def test_legacy_vaults(self):
+        self._add_legacy_vault('name-3', 'description-3', 'password-3')
+        vaults = Vaults(self.username, Connection(), self.crypt_key)
+        assert None not in self._name_indexes()
+        assert vaults.get_vault_data('name-3') == ('description-3', 'password-3')
+        statement = 'SELECT COUNT(*) FROM vault WHERE record IS NULL OR legacy_name IS NOT NULL'
+        assert Connection().query(statement, ()) == (0,)
+
+    def test_legacy_vaults_escapes(self):
+        self._add_legacy_vault('name\\x', 'tab\there', 'pass"\'\\w')
+        vaults = Vaults(self.username, Connection(), self.crypt_key)
+        assert vaults.get_vault_names() == ['name-1', 'name-2', 'name\\x']
+        assert vaults.get_vault_data('name\\x') == ('tab\there', 'pass"\'\\w')
+
+    def test_swapped_name_indexes(self):
+        statement = 'UPDATE vault SET name_index = ? WHERE username = ? AND name_index = ?'
+        (first, second) = self._name_indexes()
+        db = Connection()
+        with db.transaction():
+            db.execute(statement, ('swapped', self.username, first))
+            db.execute(statement, (first, self.username, second))
+            db.execute(statement, (second, self.username, 'swapped'))
+        vaults = Vaults(self.username, Connection(), self.crypt_key)
+        with pytest.raises(VaultException):
+            vaults.get_vault_data('name-1')
+        with pytest.raises(VaultException):
+            vaults.get_vault_names()
+        with pytest.raises(VaultException):
+            vaults.update_vaults_crypt(crypt_utils.generate_salt())
+        assert vaults._crypt_bytes == crypt_utils.byte_string(self.crypt_key)
+
+
+
+class TestUpdateVaultsCrypt:
+    def setup_method(self):
+        self.username = _account()
+        self.crypt_key = crypt_utils.generate_salt()
+        self.new_crypt_key = crypt_utils.generate_salt()
+        self.vaults = Vaults(self.username, Connection(), self.crypt_key)
+        for i in range(3):
+            self.vaults.add_vault('name-{}'.format(i), 'description-{}'.format(i), 'password-{}'.format(i))
+
+    def _assert_vaults(self, vaults):
+        assert len(vaults.get_vault_names()) == 3
+        for i in range(3):
+            data = vaults.get_vault_data('name-{}'.format(i))
+            assert data == ('description-{}'.format(i), 'password-{}'.format(i))
+
+    def test_progress(self):
+        calls = []
+        self.vaults.update_vaults_crypt(self.new_crypt_key, lambda done, total: calls.append((done, total)))
+        assert calls[-1] == (3, 3)
+        self._assert_vaults(Vaults(self.username, Connection(), self.new_crypt_key))
+
+    def test_rollback(self):
+        def interrupt(done, total):
+            raise KeyboardInterrupt()
+        with pytest.raises(KeyboardInterrupt):
+            self.vaults.update_vaults_crypt(self.new_crypt_key, interrupt)
+        self._assert_vaults(Vaults(self.username, Connection(), self.crypt_key))
+        self.vaults.edit_vault_description('name-0', 'description-0')
+        self._assert_vaults(Vaults(self.username, Connection(), self.crypt_key))
+
+
+class TestAudit:
+    def setup_method(self):
+        self.username = _account()
+        self.crypt_key = crypt_utils.generate_salt()
+        self.vaults = Vaults(self.username, Connection(), self.crypt_key)
+
+    def test_no_vaults(self):
+        assert self.vaults.audit() == []
+
+    def test_audit(self):
+        self.vaults.add_vault('name-1', 'description-1', 'password')
+        self.vaults.add_vault('name-2', 'description-2', 'unique-password-2')
+        self.vaults.add_vault('name-3', 'description-3', 'password')
+        self.vaults.add_vault('name-4', 'description-4', 'reused-password')
+        self.vaults.add_vault('name-5', 'description-5', 'reused-password')
+        vaults = Vaults(self.username, Connection(), self.crypt_key)
+        assert vaults.audit() == [
+            ('name-1', True, ['name-3']),
+            ('name-2', False, []),
+            ('name-3', True, ['name-1']),
+            ('name-4', False, ['name-5']),
+            ('name-5', False, ['name-4']),
+        ]
+
+
+class TestImport:
+    def setup_method(self):
+        self.username = _account()
+        self.crypt_key = crypt_utils.generate_salt()
+        self.vaults = Vaults(self.username, Connection(), self.crypt_key)
+        self.vaults.add_vault('name-1', 'description-1', 'password-1')
+
+    def _import(self, conflict):
+        entries = [('name-1', 'imported-1', 'imported-password-1'), ('name-2', 'imported-2', 'imported-password-2')]
+        return self.vaults.import_vaults(entries, conflict)
+
+    def test_skip(self):
+        assert self._import(constants.IMPORT_CONFLICT_SKIP) == ImportSummary(added=1, skipped=1)
+        vaults = Vaults(self.username, Connection(), self.crypt_key)
+        assert vaults.get_vault_data('name-1') == ('description-1', 'password-1')
+        assert vaults.get_vault_data('name-2') == ('imported-2', 'imported-password-2')
+
+    def test_overwrite(self):
+        assert self._import(constants.IMPORT_CONFLICT_OVERWRITE) == ImportSummary(added=1, overwritten=1)
+        assert self.vaults.get_vault_data('name-1') == ('imported-1', 'imported-password-1')
+        assert self.vaults.get_vault_names() == ['name-1', 'name-2']
+
+    def test_rename(self):
+        self.vaults.add_vault('name-1 (2)', 'description', 'password')
+        assert self._import(constants.IMPORT_CONFLICT_RENAME) == ImportSummary(added=1, renamed=1)
+        vaults = Vaults(self.username, Connection(), self.crypt_key)
+        assert vaults.get_vault_names() == ['name-1', 'name-1 (2)', 'name-1 (3)', 'name-2']
+        assert vaults.get_vault_data('name-1 (3)') == ('imported-1', 'imported-password-1')
+
+    def test_duplicates_in_import(self):
+        entries = [('name-2', 'first', 'first'), ('name-2', 'second', 'second')]
+        assert self.vaults.import_vaults(entries, constants.IMPORT_CONFLICT_OVERWRITE).overwritten == 1
+        assert self.vaults.get_vault_data('name-2') == ('second', 'second')
+
+    def test_iter_vaults(self):
+        entries = [('name-{}'.format(i), 'description', 'password') for i in range(2, 2_500)]
+        self.vaults.import_vaults(iter(entries))
+        assert list(self.vaults.iter_vaults()) == [('name-1', 'description-1', 'password-1')] + entries
+
+
+class TestSearch:
+    def setup_method(self):
+        self.username = _account()
+        self.crypt_key = crypt_utils.generate_salt()
+        self.vaults = Vaults(self.username, Connection(), self.crypt_key)
+        self.vaults.add_vault('Gmail', 'personal mail', 'password-1')
+        self.vaults.add_vault('GitHub', 'source code', 'password-2')
+        self.vaults.add_vault('Bank', 'savings account at the gmail address', 'password-3')
+
+    def test_get_vault_names_paginated(self):
+        assert self.vaults.get_vault_names() == ['Bank', 'GitHub', 'Gmail']
+        assert self.vaults.get_vault_names('G') == ['GitHub', 'Gmail']
+        assert self.vaults.get_vault_names('G', offset=1) == ['Gmail']
+        assert self.vaults.get_vault_names(limit=2) == ['Bank', 'GitHub']
+        assert self.vaults.get_vault_names('Gi', limit=5) == ['GitHub']
+        assert self.vaults.get_vault_names('X') == []
+        with pytest.raises(VaultException):
+            self.vaults.get_vault_names('G', offset=-1, limit=2)
+        with pytest.raises(VaultException):
+            self.vaults.get_vault_names(limit=-1)
+
+    def test_ranking(self):
+        self.vaults.add_vault('Gmail work', 'office', 'password-4')
+        assert self.vaults.search('gmail') == ['Gmail', 'Gmail work', 'Bank']
+        assert self.vaults.search('hub') == ['GitHub']
+        assert self.vaults.search('code') == ['GitHub']
+        assert self.vaults.search('gmail', limit=1) == ['Gmail']
+        assert self.vaults.search('  ') == []
+
+    def test_fuzzy(self):
+        assert self.vaults.search('gmial') == ['Gmail']
+        assert self.vaults.search('zzzz') == []
+
+    def test_incremental(self):
+        assert self.vaults.search('bank') == ['Bank']
+        self.vaults.edit_vault_name('Bank', 'Credit Union')
+        self.vaults.edit_vault_description('GitHub', 'credit card')
+        self.vaults.delete_vault('Gmail')
+        self.vaults.add_vault('Gmx', 'mail', 'password-5')
+        assert self.vaults.search('bank') == []
+        assert self.vaults.search('credit') == ['Credit Union', 'GitHub']
+        assert self.vaults.search('mail') == ['Credit Union', 'Gmx']
+        assert self.vaults.get_vault_names() == ['Credit Union', 'GitHub', 'Gmx']
+        vaults = Vaults(self.username, Connection(), self.crypt_key)
+        assert vaults.search('credit') == ['Credit Union', 'GitHub']
+
+    def test_import(self):
+        assert self.vaults.search('netflix') == []
+        self.vaults.import_vaults([('Netflix', 'streaming', 'password-4')])
+        assert self.vaults.search('netflix') == ['Netflix']